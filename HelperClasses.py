@@ -1,15 +1,985 @@
 #! /usr/bin/env python
 
 import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice, compress
+from collections import OrderedDict
 
 
+import importlib
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+
+
+class LazyImport:
+    def __init__(self, module: str, attr: str = None):
+        """
+        Stands in for a module, or one of its attributes, and only imports it on first use.
+        Plotting and clustering libraries take seconds to import and many callers never touch them.
+        
+        Parameters
+        ----------
+        module: string
+            Module to import, e.g. 'sklearn.cluster'
+            
+        attr: string, default=None
+            Attribute of the module to stand in for, e.g. 'DBSCAN'
+        """
+        self._module = module
+        self._attr = attr
+        self._obj = None
+        
+        
+    def _load(self):
+        if self._obj is None:
+            obj = importlib.import_module(self._module)
+            self._obj = getattr(obj, self._attr) if self._attr else obj
+        return self._obj
+    
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+    
+    
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+#heavy dependencies load when first used
+plt = LazyImport('matplotlib.pyplot')
+patches = LazyImport('matplotlib.patches')
+Path = LazyImport('matplotlib.path', 'Path')
+DBSCAN = LazyImport('sklearn.cluster', 'DBSCAN')
+NearestNeighbors = LazyImport('sklearn.neighbors', 'NearestNeighbors')
+connected_components = LazyImport('scipy.sparse.csgraph', 'connected_components')
+Image = LazyImport('PIL.Image')
 
 
      
+####################################################        
+####################################################   
+
+class StageTimer:
+    def __init__(self, enabled: bool = False):
+        """
+        Records wall time, row counts and resident memory deltas of named stages.
+        When disabled, stage() does nothing but hand back an unused dict.
+        
+        Parameters
+        ----------
+        enabled: bool, default=False
+            Whether stages are recorded
+        """
+        self.enabled = enabled
+        self.records = []
+        self._profiler = None
+        
+        
+    def reset(self, enabled: bool = None):
+        """
+        Drops the recorded stages, e.g. at the start of a Streamlit rerun, and optionally toggles recording.
+        """
+        self.records = []
+        if enabled is not None:
+            self.enabled = enabled
+            
+            
+    def _rssMB(self):
+        """
+        Resident memory of the process in MB, None where /proc is not available.
+        """
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+        except (OSError, ValueError, AttributeError):
+            return None
+        
+        
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Context manager timing the code inside it. Set info['rows'] inside the block
+        to record a row count that is only known at the end.
+        
+        Parameters
+        ----------
+        name: string
+            Name of the stage
+            
+        rows: int, default=None
+            Number of rows handled by the stage
+        """
+        info = {'rows': rows}
+        if not self.enabled:
+            yield info
+            return
+        
+        rss = self._rssMB()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = self._rssMB()
+            self.records.append({'stage': name, 
+                                 'seconds': seconds, 
+                                 'rows': info['rows'], 
+                                 'mem_delta_mb': rss_after - rss if rss is not None else None})
+            
+            
+    def record(self, name, seconds, rows=None):
+        """
+        Adds a stage timed elsewhere, e.g. module imports that run before any stage can be opened.
+        """
+        if self.enabled:
+            self.records.append({'stage': name, 
+                                 'seconds': seconds, 
+                                 'rows': rows, 
+                                 'mem_delta_mb': None})
+            
+            
+    def report(self):
+        """
+        Returns the recorded stages as a dataframe.
+        """
+        return pd.DataFrame(self.records, columns=['stage', 'seconds', 'rows', 'mem_delta_mb'])
+    
+    
+    def startProfile(self):
+        """
+        Starts cProfile, used to profile a single rerun.
+        """
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        
+        
+    def stopProfile(self, path=None, top=30):
+        """
+        Stops cProfile and returns the top functions by cumulative time as text.
+        
+        Parameters
+        ----------
+        path: string, default=None
+            If set, dump the raw stats there for snakeviz or pstats
+            
+        top: int, default=30
+            Number of functions listed
+        """
+        if self._profiler is None:
+            return ''
+        self._profiler.disable()
+        if path is not None:
+            self._profiler.dump_stats(path)
+            
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        self._profiler = None
+        return out.getvalue()
+    
+    
+#timers bound per thread, Streamlit runs every session's script in its own thread
+_bound = threading.local()
+_disabled_timer = StageTimer(enabled=False)
+
+
+def useTimer(stage_timer):
+    """
+    Binds a StageTimer to the calling thread so the helper classes record into it.
+    Each app run creates its own timer and binds it, so sessions never share records, 
+    switches or profilers. None unbinds it.
+    """
+    _bound.timer = stage_timer
+    return stage_timer
+
+
+def currentTimer():
+    """
+    Returns the StageTimer bound to the calling thread, or a disabled one if there is none.
+    """
+    stage_timer = getattr(_bound, 'timer', None)
+    return _disabled_timer if stage_timer is None else stage_timer
+
+
+def profilePath(prefix):
+    """
+    File name for the profile of one rerun, unique per thread and time so that 
+    concurrent sessions do not overwrite each other's profiles.
+    """
+    return f'{prefix}_{threading.get_ident()}_{time.strftime("%Y%m%d-%H%M%S")}_{time.time_ns() % 10**9:09d}.prof'
+
+
+def iterJsonRecords(path: str, buffer_size: int = 1 << 16):
+    """
+    Generator over the records of a JSON array file, parsed one at a time.
+    Only the record being decoded and one read buffer are held in memory.
+    
+    Parameters
+    ----------
+    path: string
+        Path to a JSON file whose top level is an array
+        
+    buffer_size: int, default=65536
+        Number of characters read from disk at once
+    """
+    decoder = json.JSONDecoder()
+    
+    with open(path, 'r') as f:
+        buf = ''
+        pos = 0
+        eof = False
+        started = False
+        
+        while True:
+            #skip whitespace and separators between records
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+                
+            #refill when the buffer is exhausted
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f'Unexpected end of file in "{path}".')
+                buf = f.read(buffer_size)
+                pos = 0
+                eof = len(buf) < buffer_size
+                continue
+            
+            #the file must open with an array
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError(f'File "{path}" must contain a JSON array.')
+                started = True
+                pos += 1
+                continue
+                
+            #end of the array
+            if buf[pos] == ']':
+                return
+            
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                #record spans past the buffer, read more and try again
+                if eof:
+                    raise
+                chunk = f.read(buffer_size)
+                eof = len(chunk) < buffer_size
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+                
+            pos = end
+            yield record
+            
+            
+def iterChunks(iterable, chunk_size: int):
+    """
+    Groups an iterable into lists of at most chunk_size items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+        
+        
+#compact schema of the flattened ward tables
+#   match_id   int64     OpenDota ids do not fit in 32 bits
+#   start_time           left as parsed (datetime from JSON, epoch seconds from CSV)
+#   hero_id    category  less than 256 heroes
+#   account_id Int64     nullable, anonymous players have none
+#   time       int16     seconds from the horn, games never reach 9 hours
+#   x, y, z    uint8     cells on the 128 grid, offset by 64 (translate in a wider type)
+#   is_radiant bool
+WARD_DTYPES = {'match_id': np.int64,
+               'hero_id': 'category',
+               'account_id': 'Int64',
+               'time': np.int16,
+               'x': np.uint8,
+               'y': np.uint8,
+               'z': np.uint8,
+               'is_radiant': bool}
+
+#compact schema of the wide objectives table
+#   match_id   int64
+#   any other  Int16     building or Roshan kill time in seconds, nullable for objectives not taken
+OBJECTIVE_DTYPE = 'Int16'
+
+
+def compactWards(df):
+    """
+    Casts a ward dataframe to WARD_DTYPES. Columns not in the schema are left untouched.
+    """
+    return df.astype({k: v for k, v in WARD_DTYPES.items() if k in df.columns})
+
+
+def compactObjectives(df):
+    """
+    Casts an objectives dataframe to the compact schema, every time column becomes OBJECTIVE_DTYPE.
+    """
+    dtypes = {c: OBJECTIVE_DTYPE for c in df.columns if c != 'match_id'}
+    dtypes['match_id'] = np.int64
+    return df.astype(dtypes)
+
+
+def memoryReport(before: dict, after: dict):
+    """
+    Returns a dataframe of memory use in MB per table, before and after compaction.
+    
+    Parameters
+    ----------
+    before: dict
+        Table name to Pandas dataframe before compaction
+        
+    after: dict
+        Table name to Pandas dataframe after compaction
+    """
+    rows = []
+    for name in before:
+        mb_before = before[name].memory_usage(deep=True).sum() / 2**20
+        mb_after = after[name].memory_usage(deep=True).sum() / 2**20
+        rows.append({'table': name, 
+                     'rows': len(after[name]),
+                     'mb_before': mb_before, 
+                     'mb_after': mb_after, 
+                     'ratio': mb_before / mb_after if mb_after else np.nan})
+    return pd.DataFrame(rows).set_index('table')
+
+
+def translateWards(df):
+    """
+    Moves raw map coordinates (64 to 191) to 0 to 127 and converts time to minutes, in place, as the apps use them.
+    """
+    #widen first so uint8 does not wrap around
+    df['x'] = df['x'].astype(np.int16) - 64
+    df['y'] = df['y'].astype(np.int16) - 64
+    df['time'] = df['time'] / 60
+    return df
+
+
+def cellDBSCAN(cells, weights, eps=3, min_samples=100, n_jobs=-1):
+    """
+    DBSCAN over map cells where each cell stands for weights[i] wards.
+    
+    Parameters
+    ----------
+    cells: array of shape (n, 2)
+        Coordinates of every cell
+        
+    weights: array of shape (n,)
+        Number of wards in every cell
+        
+    eps : float, default=3
+        The maximum distance between two samples for one to be considered
+        as in the neighborhood of the other.
+        
+    min_samples: int, default=100
+        Number of wards in a neighborhood for a point to be considered a core point
+        
+    n_jobs: int, default=-1
+        Number of parallel jobs for the neighbor search
+    """
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    db = DBSCAN(eps=eps, 
+                min_samples=min_samples, 
+                metric='euclidean', 
+                n_jobs=n_jobs
+               )
+    with currentTimer().stage('dbscan', rows=len(cells)):
+        db.fit(cells, sample_weight=weights)
+    
+    return db.labels_
+
+
+def gridDBSCAN(xy, eps=3, min_samples=100, n_jobs=-1):
+    """
+    DBSCAN over the unique cells of the map weighted by how many wards fall in each.
+    Gives the same labels as running DBSCAN on every row since duplicates share neighborhoods,
+    cells are visited in order of first appearance so cluster numbering and border points match too.
+    
+    Parameters
+    ----------
+    xy: array of shape (n, 2)
+        Coordinates of every ward
+        
+    eps : float, default=3
+        The maximum distance between two samples for one to be considered
+        as in the neighborhood of the other.
+        
+    min_samples: int, default=100
+        Number of wards in a neighborhood for a point to be considered a core point
+        
+    n_jobs: int, default=-1
+        Number of parallel jobs for the neighbor search
+    """
+    xy = np.asarray(xy)
+    if len(xy) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    cells, counts, rows = uniqueCells(xy)
+    labels = cellDBSCAN(cells, 
+                        counts, 
+                        eps=eps, 
+                        min_samples=min_samples, 
+                        n_jobs=n_jobs)
+    
+    #map cell labels back to rows
+    return labels[rows]
+
+
+def uniqueCells(xy):
+    """
+    Collapses rows onto unique cells ordered by first appearance.
+    Returns the cells, the number of rows in each and the cell of every row.
+    """
+    #integer grids are packed into one key for a faster sort
+    if np.issubdtype(xy.dtype, np.integer):
+        lo = xy.min(axis=0).astype(np.int64)
+        width = int(xy[:, 1].max()) - lo[1] + 1
+        keys = (xy[:, 0] - lo[0]) * width + (xy[:, 1] - lo[1])
+        _, first, inverse, counts = np.unique(keys, 
+                                              return_index=True, 
+                                              return_inverse=True, 
+                                              return_counts=True)
+        cells = xy[first]
+    else:
+        cells, first, inverse, counts = np.unique(xy, 
+                                                  axis=0, 
+                                                  return_index=True, 
+                                                  return_inverse=True, 
+                                                  return_counts=True)
+    
+    #reorder cells by first appearance to mimic row order
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return cells[order], counts[order], rank[inverse.ravel()]
+
+
+def _sweepTask(task):
+    """
+    Labels for a list of settings derived from one shared neighbor graph inside a worker process.
+    Clusters are the connected components of core cells numbered by their first core cell, and a border
+    cell takes the lowest numbered cluster among its core neighbors, which is what DBSCAN does when it
+    visits cells in order.
+    """
+    graph, counts, settings = task
+    out = []
+    for eps in sorted(set(eps for eps, _ in settings)):
+        #neighbors within this eps, self loops have distance 0 and stay
+        near = graph.copy()
+        near.data = (near.data <= eps).astype(np.int8)
+        near.eliminate_zeros()
+        weight = near @ counts
+        
+        for min_samples in [m for e, m in settings if e == eps]:
+            core = weight >= min_samples
+            core_idx = np.nonzero(core)[0]
+            labels = np.full(len(counts), -1, dtype=np.int64)
+            if len(core_idx):
+                n_components, component = connected_components(near[core_idx][:, core_idx], directed=False)
+                #number components by their first core cell, core_idx is sorted
+                first = np.full(n_components, len(counts))
+                np.minimum.at(first, component, np.arange(len(core_idx)))
+                rank = np.empty(n_components, dtype=np.int64)
+                rank[np.argsort(first)] = np.arange(n_components)
+                labels[core_idx] = rank[component]
+                
+                border = near[~core][:, core_idx].tocsr()
+                has_core = np.diff(border.indptr) > 0
+                if has_core.any():
+                    values = labels[core_idx][border.indices]
+                    starts = border.indptr[:-1][has_core]
+                    labels[np.nonzero(~core)[0][has_core]] = np.minimum.reduceat(values, starts)
+            out.append(((eps, min_samples), labels))
+    return out
+
+
+def sweepDBSCAN(subdivisions, eps_values, min_samples_values, n_jobs=-1):
+    """
+    DBSCAN over a grid of eps and min_samples for one or more ward subdivisions. The radius
+    neighbor graph of each subdivision's unique cells is computed once at the largest eps and every
+    setting reuses it, the settings are spread over processes. Labels are the same as gridDBSCAN.
+    
+    Parameters
+    ----------
+    subdivisions: dict or array of shape (n, 2)
+        Coordinates of every ward, or a dictionary of name to coordinates, e.g. the four team and type subdivisions
+        
+    eps_values: list
+        Values of eps to try
+        
+    min_samples_values: list
+        Values of min_samples to try
+        
+    n_jobs: int, default=-1
+        Number of processes, -1 for all cores
+        
+    Returns
+    -------
+    summary: Pandas dataframe
+        One row per subdivision and setting with columns 'subdivision', 'eps', 'min_samples', 
+        'n_clusters' and 'noise_fraction'
+        
+    labels: dict
+        Row labels keyed by (subdivision, eps, min_samples)
+    """
+    if not isinstance(subdivisions, dict):
+        subdivisions = {None: subdivisions}
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    settings = [(float(eps), int(m)) for eps in eps_values for m in min_samples_values]
+    
+    tasks, meta = [], []
+    with currentTimer().stage('sweep_graph', rows=sum(len(xy) for xy in subdivisions.values())):
+        for name, xy in subdivisions.items():
+            xy = np.asarray(xy)
+            if len(xy) == 0:
+                continue
+            cells, counts, rows = uniqueCells(xy)
+            nn = NearestNeighbors(radius=max(eps for eps, _ in settings)).fit(cells)
+            graph = nn.radius_neighbors_graph(cells, mode='distance')
+            #settings of one eps share a thresholded graph so they are chunked by eps
+            eps_chunks = np.array_split(sorted(set(eps for eps, _ in settings)), 
+                                        min(n_jobs, len(eps_values)))
+            for chunk in eps_chunks:
+                if len(chunk):
+                    tasks.append((graph, counts, [(e, m) for e, m in settings if e in chunk]))
+                    meta.append((name, rows))
+    
+    with currentTimer().stage('sweep_fit', rows=len(settings) * len(subdivisions)):
+        if n_jobs == 1 or len(tasks) < 2:
+            results = [_sweepTask(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(_sweepTask, tasks))
+    
+    summary, labels = [], {}
+    for (name, rows), result in zip(meta, results):
+        for (eps, min_samples), cell_label in result:
+            row_labels = cell_label[rows]
+            labels[(name, eps, min_samples)] = row_labels
+            summary.append({'subdivision': name, 
+                            'eps': eps, 
+                            'min_samples': min_samples, 
+                            'n_clusters': int(row_labels.max()) + 1 if len(row_labels) else 0, 
+                            'noise_fraction': float(np.mean(row_labels < 0))})
+    
+    return pd.DataFrame(summary), labels
+
+
+class IncrementalDBSCAN:
+    def __init__(self, eps=3, min_samples=100, origin: int = -64, size: int = 256):
+        """
+        DBSCAN over integer map cells that is updated with batches of new wards instead of refitting.
+        Neighborhood counts, core cells and border cells only change within eps of a new ward, and
+        since wards are only ever added, core cells stay core and clusters can only grow or merge,
+        which a union-find over core cells tracks exactly.
+        
+        Cluster ids are the smallest cell key of the cluster, so they stay put until the cluster
+        merges into one with a smaller key.
+        
+        Parameters
+        ----------
+        eps : float, default=3
+            The maximum distance between two samples for one to be considered
+            as in the neighborhood of the other.
+            
+        min_samples: int, default=100
+            Number of wards in a neighborhood for a point to be considered a core point
+            
+        origin: int, default=-64
+            Smallest x and y on the grid, the default fits raw and translated coordinates
+            
+        size: int, default=256
+            Number of cells along each side of the grid
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+        self.origin = origin
+        self.size = size
+        
+        r = int(np.floor(eps))
+        dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+        disk = dx ** 2 + dy ** 2 <= eps ** 2
+        self.offsets = np.stack([dx[disk], dy[disk]], axis=1)
+        
+        n = size * size
+        self.weights = np.zeros(n, dtype=np.int64)
+        #wards within eps of each cell, itself included
+        self.neighbors = np.zeros(n, dtype=np.int64)
+        self.core = np.zeros(n, dtype=bool)
+        self.parent = np.arange(n)
+        #core cell a border cell hangs on to, -1 for none
+        self.anchor = np.full(n, -1, dtype=np.int64)
+        self.centers = {}
+        
+        
+    def _keys(self, xy):
+        xy = np.asarray(xy, dtype=np.int64) - self.origin
+        if len(xy) and (xy.min() < 0 or xy.max() >= self.size):
+            raise ValueError(f'Coordinates must be between {self.origin} and {self.origin + self.size - 1}.')
+        return xy[:, 0] * self.size + xy[:, 1]
+    
+    
+    def _disk(self, keys):
+        """
+        Keys of the cells within eps of each cell as an array of shape (len(keys), offsets)
+        in offset order, -1 where the neighbor is off the grid.
+        """
+        x, y = np.divmod(np.asarray(keys, dtype=np.int64), self.size)
+        nx, ny = x[:, None] + self.offsets[:, 0], y[:, None] + self.offsets[:, 1]
+        on_grid = (nx >= 0) & (nx < self.size) & (ny >= 0) & (ny < self.size)
+        return np.where(on_grid, nx * self.size + ny, -1)
+    
+    
+    def _find(self, key):
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        #path compression
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+    
+    
+    def _roots(self):
+        """
+        Cluster id of every cell, -1 for empty and noise cells.
+        """
+        parent = self.parent.copy()
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        labels = np.full(len(parent), -1, dtype=np.int64)
+        labels[self.core] = parent[self.core]
+        border = self.anchor >= 0
+        labels[border] = parent[self.anchor[border]]
+        return labels
+    
+    
+    def update(self, xy):
+        """
+        Adds a batch of wards and returns a dictionary with the ids of the clusters that 
+        changed ('changed') and of the ones merged into another ('removed').
+        
+        Parameters
+        ----------
+        xy: array of shape (n, 2)
+            Integer coordinates of the new wards
+        """
+        with currentTimer().stage('dbscan_update', rows=len(xy)):
+            before = self._roots()
+            keys, counts = np.unique(self._keys(xy), return_counts=True)
+            self.weights[keys] += counts
+            
+            #neighborhood counts only move around the new cells
+            disks = self._disk(keys)
+            on_grid = disks >= 0
+            np.add.at(self.neighbors, disks[on_grid], np.broadcast_to(counts[:, None], disks.shape)[on_grid])
+            touched = np.unique(disks[on_grid])
+            
+            new_core = touched[(self.weights[touched] > 0) & 
+                               (self.neighbors[touched] >= self.min_samples) & 
+                               ~self.core[touched]]
+            self.core[new_core] = True
+            self.anchor[new_core] = -1
+            
+            #link new cores to every core within eps, the smaller key becomes the root
+            disks = self._disk(new_core)
+            linked = (disks >= 0) & self.core[disks]
+            for key, other in zip(np.repeat(new_core, linked.sum(axis=1)), disks[linked]):
+                a, b = self._find(key), self._find(other)
+                if a != b:
+                    self.parent[max(a, b)] = min(a, b)
+            
+            #occupied non core cells near a new core or newly occupied can become border cells
+            candidates = np.unique(np.concatenate([keys, disks[disks >= 0]]))
+            candidates = candidates[(self.weights[candidates] > 0) & 
+                                    ~self.core[candidates] & 
+                                    (self.anchor[candidates] < 0)]
+            disks = self._disk(candidates)
+            cores = (disks >= 0) & self.core[disks]
+            reached = cores.any(axis=1)
+            #first core in offset order
+            self.anchor[candidates[reached]] = disks[reached, cores[reached].argmax(axis=1)]
+            
+            after = self._roots()
+            moved = before != after
+            changed = set(np.unique(after[moved & (after >= 0)]).tolist())
+            #a cell that only gained wards changes the centroid of its cluster too
+            changed |= set(np.unique(after[keys][after[keys] >= 0]).tolist())
+            removed = set(np.unique(before[moved & (before >= 0)]).tolist()) - set(np.unique(after[after >= 0]).tolist())
+            
+            #only the centroids of changed clusters are recomputed
+            for cluster in removed:
+                self.centers.pop(cluster, None)
+            if changed:
+                ids = np.array(sorted(changed))
+                members = np.nonzero(np.isin(after, ids))[0]
+                pos = np.searchsorted(ids, after[members])
+                w = self.weights[members].astype(np.float64)
+                total = np.bincount(pos, weights=w, minlength=len(ids))
+                cx = np.bincount(pos, weights=w * (members // self.size + self.origin), minlength=len(ids)) / total
+                cy = np.bincount(pos, weights=w * (members % self.size + self.origin), minlength=len(ids)) / total
+                self.centers.update({int(c): (x, y) for c, x, y in zip(ids, cx, cy)})
+        
+        return {'changed': sorted(changed), 'removed': sorted(removed)}
+    
+    
+    def labels(self, xy):
+        """
+        Returns the cluster id of every ward in xy, -1 for noise.
+        """
+        return self._roots()[self._keys(xy)]
+    
+    
+    def centroids(self):
+        """
+        Returns a dictionary of cluster id to the ward weighted centroid (x, y) of the cluster.
+        """
+        return dict(self.centers)
+    
+    
+    def consistencyCheck(self):
+        """
+        Refits DBSCAN from scratch on the current cells and compares. Core cells, noise cells and the
+        clusters of core cells must match exactly. A border cell within eps of several clusters can
+        legitimately go to any of them, so it only has to belong to a cluster it is within reach of.
+        Returns a dictionary of checks along with 'ok' when all of them pass.
+        """
+        occupied = np.nonzero(self.weights)[0]
+        report = {'cores': True, 'noise': True, 'clusters': True, 'borders': True}
+        if len(occupied):
+            cells = np.stack([occupied // self.size, occupied % self.size], axis=1) + self.origin
+            db = DBSCAN(eps=self.eps, min_samples=self.min_samples, metric='euclidean')
+            db.fit(cells, sample_weight=self.weights[occupied])
+            ref_core = np.zeros(len(occupied), dtype=bool)
+            ref_core[db.core_sample_indices_] = True
+            
+            ours = self._roots()[occupied]
+            core = self.core[occupied]
+            report['cores'] = bool(np.array_equal(core, ref_core))
+            report['noise'] = bool(np.array_equal(ours < 0, db.labels_ < 0))
+            
+            #the two labelings of core cells must be a one to one mapping
+            if report['cores']:
+                pairs = np.unique(np.stack([ours[core], db.labels_[core]], axis=1), axis=0)
+                report['clusters'] = bool(len(np.unique(pairs[:, 0])) == len(pairs) == len(np.unique(pairs[:, 1])))
+            
+            #each border cell needs a core of its own cluster within eps
+            border = ~core & (ours >= 0)
+            disks = self._disk(occupied[border])
+            cores = (disks >= 0) & self.core[disks]
+            reach = np.where(cores, self._roots()[disks], -2)
+            report['borders'] = bool((reach == ours[border][:, None]).any(axis=1).all())
+                
+        report['ok'] = all(report.values())
+        return report
+    
+    
+#lanes in the order of the A?_B?_C?_D?_E?_F? combos used by appWardObjectives
+LANES = ['radiant_top', 'radiant_mid', 'radiant_bot', 'dire_top', 'dire_mid', 'dire_bot']
+
+
+def comboCode(states):
+    """
+    Packs the tier of the last captured tower in each of the six lanes (0 to 3) into one integer,
+    two bits per lane with lane A in the highest bits. Works on a sequence of 6 ints or an (n, 6) array.
+    """
+    states = np.asarray(states, dtype=np.uint16)
+    shifts = np.arange(len(LANES) - 1, -1, -1, dtype=np.uint16) * 2
+    return (states << shifts).sum(axis=-1).astype(np.uint16)
+
+
+def comboName(code):
+    """
+    Returns the 'A1_B1_C2_D0_E0_F0' style name of a combo code.
+    """
+    states = [(int(code) >> (2 * (len(LANES) - 1 - i))) & 3 for i in range(len(LANES))]
+    return '_'.join(f'{letter}{state}' for letter, state in zip('ABCDEF', states))
+
+
+def comboFromName(name):
+    """
+    Returns the combo code of an 'A1_B1_C2_D0_E0_F0' style name.
+    """
+    return int(comboCode([int(part[1:]) for part in name.split('_')]))
+
+
+def towerStates(df_wards, df_obj):
+    """
+    Returns an (n, 6) array with, for every ward, the tier of the last tower captured in each lane
+    at the moment the ward was placed (0 if none). Lanes follow LANES.
+    Uses a binary search over the sorted kill times of each match instead of merging the wide table.
+    
+    Parameters
+    ----------
+    df_wards: Pandas dataframe
+        Wards with columns 'match_id' and 'time' in seconds
+        
+    df_obj: Pandas dataframe
+        Wide objectives table from ObjectiveFinder with radiant/dire column names
+    """
+    match_ids = df_wards['match_id'].to_numpy()
+    ward_time = df_wards['time'].to_numpy().astype(np.int64)
+    states = np.zeros((len(df_wards), len(LANES)), dtype=np.uint8)
+    
+    if len(df_obj) == 0:
+        return states
+    
+    #matches are numbered by position in the objectives table
+    obj_ids = df_obj['match_id'].to_numpy()
+    obj_order = np.argsort(obj_ids, kind='stable')
+    pos = np.minimum(np.searchsorted(obj_ids[obj_order], match_ids), len(obj_ids) - 1)
+    ward_match = np.where(obj_ids[obj_order][pos] == match_ids, obj_order[pos], -1)
+    
+    #times are shifted so that they sort inside a match
+    span = 1 << 20
+    ward_key = ward_match.astype(np.int64) * span + ward_time + span // 2
+    
+    for i, lane in enumerate(LANES):
+        team, side = lane.split('_')
+        #every kill of a tower of this lane as (match, time, tier)
+        ev_match, ev_time, ev_tier = [], [], []
+        for tier in (1, 2, 3):
+            col = f'{team}_tower{tier}_{side}'
+            if col not in df_obj.columns:
+                continue
+            t = pd.to_numeric(df_obj[col], errors='coerce').to_numpy(dtype=np.float64)
+            taken = np.flatnonzero(~np.isnan(t))
+            ev_match.append(taken)
+            ev_time.append(t[taken].astype(np.int64))
+            ev_tier.append(np.full(len(taken), tier, dtype=np.uint8))
+        if not ev_match:
+            continue
+        
+        ev_match = np.concatenate(ev_match)
+        ev_time = np.concatenate(ev_time)
+        ev_tier = np.concatenate(ev_tier)
+        ev_key = ev_match.astype(np.int64) * span + ev_time + span // 2
+        
+        order = np.argsort(ev_key, kind='stable')
+        ev_key, ev_match, ev_tier = ev_key[order], ev_match[order], ev_tier[order]
+        #highest tier taken so far inside each match, towers may fall out of order
+        ev_tier = pd.Series(ev_tier).groupby(ev_match).cummax().to_numpy()
+        
+        #last kill at or before the ward, it must belong to the same match
+        last = np.searchsorted(ev_key, ward_key, side='right') - 1
+        valid = (last >= 0) & (ward_match >= 0)
+        valid[valid] = ev_match[last[valid]] == ward_match[valid]
+        states[valid, i] = ev_tier[last[valid]]
+        
+    return states
+
+
+def roshanWards(df_wards, df_obj, attempt: int = 1, index=None):
+    """
+    Returns the wards placed in the upper left quadrant of the map while going for the n-th Roshan,
+    i.e. after the previous Roshan kill (or the start of the game) and up to the n-th kill.
+    Matches where Roshan was not killed n times are left out.
+    
+    Parameters
+    ----------
+    df_wards: Pandas dataframe
+        Wards with raw coordinates and columns 'match_id' and 'time' in seconds
+        
+    df_obj: Pandas dataframe
+        Wide objectives table from ObjectiveFinder
+        
+    attempt: int, default=1
+        Roshan attempt number starting at 1
+        
+    index: SpatialIndex, default=None
+        Index over df_wards, if given only the quadrant's rows are looked at
+    """
+    if index is not None:
+        #upper left quadrant in raw coordinates
+        df_wards = index.rect(x1=128, y0=128)
+        
+    df_obj = df_obj.drop_duplicates(subset='match_id', keep='first').set_index('match_id')
+    
+    end_col = f'ROSHAN_{attempt - 1}'
+    start_col = f'ROSHAN_{attempt - 2}'
+    if end_col not in df_obj.columns:
+        return df_wards.iloc[:0]
+    
+    end = df_wards['match_id'].map(df_obj[end_col]).to_numpy(dtype=np.float64)
+    if start_col in df_obj.columns:
+        start = df_wards['match_id'].map(df_obj[start_col]).to_numpy(dtype=np.float64)
+    else:
+        start = np.full(len(df_wards), -np.inf)
+    
+    time = df_wards['time'].to_numpy()
+    x = df_wards['x'].to_numpy().astype(np.int16) - 64
+    y = df_wards['y'].to_numpy().astype(np.int16) - 64
+    #comparisons with NaN are False, matches without the kill drop out
+    mask = (time > start) & (time <= end) & (x < 64) & (y >= 64)
+    
+    return df_wards[mask]
+
+
+class ComboIndex:
+    def __init__(self, df):
+        """
+        Groups the rows of a ward dataframe by combo code so that the wards of one
+        tower state are a slice lookup rather than a scan.
+        
+        Parameters
+        ----------
+        df: Pandas dataframe
+            Wards with a 'combo' column, see comboCode
+        """
+        self.df = df
+        codes = df['combo'].to_numpy().astype(np.int64)
+        #rows sorted by combo, bounds[c]:bounds[c+1] are the rows of combo c
+        self.order = np.argsort(codes, kind='stable')
+        self.bounds = np.zeros(4 ** len(LANES) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=4 ** len(LANES)), out=self.bounds[1:])
+        
+        
+    def count(self, combo):
+        """
+        Number of wards placed under a combo, given as a code or a name.
+        """
+        code = comboFromName(combo) if isinstance(combo, str) else int(combo)
+        return int(self.bounds[code + 1] - self.bounds[code])
+    
+    
+    def get(self, combo):
+        """
+        Returns the wards placed under a combo, given as a code or a name.
+        """
+        code = comboFromName(combo) if isinstance(combo, str) else int(combo)
+        return self.df.iloc[self.order[self.bounds[code]:self.bounds[code + 1]]]
+
+
+def recordsToDataframe(records):
+    """
+    Builds a dataframe from raw match records the same way pd.read_json would,
+    i.e. start_time is converted from epoch seconds to datetime.
+    """
+    df = pd.DataFrame.from_records(records)
+    if 'start_time' in df.columns:
+        df['start_time'] = pd.to_datetime(df['start_time'], unit='s')
+    return df
+
+
 ####################################################        
 ####################################################   
 
@@ -92,33 +1062,107 @@ class ObjectiveFinder:
             obj_arr.append(d)
 
         return pd.DataFrame(obj_arr)
-
-
-
-    def getObjectiveData(self):
+    
+    
+    def _renameTeams(self, df):
         """
-        Reads files inside folder and returns dataframe of objectives. No arguments needed.
+        Cosmetic changes to column names, replaces building prefixes with team names.
         """
-        df_arr = []
+        # TODO: looks too wordy, maybe find a way to shorten it
+        df.columns = df.columns.str.replace('npc_dota_goodguys','radiant')
+        df.columns = df.columns.str.replace('npc_dota_badguys','dire')
+        return df
+    
+    
+    def iterObjectiveData(self, chunk_size: int = 10_000, seen_matches=None):
+        """
+        Generator that streams files inside folder one record at a time and yields
+        dataframes of objectives. Peak memory depends on chunk_size, not on file size.
         
+        Parameters
+        ----------
+        chunk_size: int, default=10_000
+            Maximum number of raw records flattened at once
+
+            
+        seen_matches: SeenMatches, default=None
+            If given, records of matches another file already brought in are skipped
+        """
         for file in self.files:
             #set the path
             data_path = os.path.join(self.folder, file)
-            #read data
-            df = pd.read_json(data_path)
-            #organize
-            df_obj = self._getObjectiveDataframe(df)
-            #append
-            df_arr.append(df_obj)
+            #matches already seen in this file
+            seen = set()
             
-        self.df_obj = pd.concat(df_arr)
+            for records in iterChunks(iterJsonRecords(data_path), chunk_size):
+                if seen_matches is not None:
+                    keep = seen_matches.check(file, [r['match_id'] for r in records])
+                    records = list(compress(records, keep))
+                    
+                #keep first record of unseen matches, drop everything else early
+                keep = []
+                for r in records:
+                    if r['match_id'] not in seen:
+                        seen.add(r['match_id'])
+                        keep.append({'match_id': r['match_id'], 
+                                     'objectives': r['objectives']})
+                if not keep:
+                    continue
+                    
+                df_obj = self._getObjectiveDataframe(pd.DataFrame(keep))
+                yield self._renameTeams(df_obj)
                 
+            if seen_matches is not None:
+                seen_matches.commit(file)
         
         
-        #cosmetic changes to column names
-        # TODO: looks too wordy, maybe find a way to shorten it
-        self.df_obj.columns = self.df_obj.columns.str.replace('npc_dota_goodguys','radiant')
-        self.df_obj.columns = self.df_obj.columns.str.replace('npc_dota_badguys','dire')
+    def getObjectiveData(self, chunk_size: int = None, compact: bool = False, seen_matches=None):
+        """
+        Reads files inside folder and returns dataframe of objectives.
+        
+        Parameters
+        ----------
+        chunk_size: int, default=None
+            If set, stream the files with iterObjectiveData instead of loading
+            each one whole with pd.read_json.
+            
+        compact: bool, default=False
+            If True cast the output to the compact schema, see compactObjectives.
+            
+        seen_matches: SeenMatches, default=None
+            If given, rows of matches another file already brought in are dropped before extraction
+        """
+        df_arr = []
+        
+        if chunk_size is not None:
+            df_arr = list(self.iterObjectiveData(chunk_size=chunk_size, seen_matches=seen_matches))
+        
+        else:
+            for file in self.files:
+                #set the path
+                data_path = os.path.join(self.folder, file)
+                #read data
+                with currentTimer().stage('read_json') as info:
+                    df = pd.read_json(data_path)
+                    info['rows'] = len(df)
+                if seen_matches is not None:
+                    df = df[seen_matches.check(file, df['match_id'])]
+                    seen_matches.commit(file)
+                    if df.empty:
+                        continue
+                #organize
+                with currentTimer().stage('objectives', rows=len(df)):
+                    df_obj = self._getObjectiveDataframe(df)
+                #append
+                df_arr.append(df_obj)
+            
+        self.df_obj = pd.concat(df_arr)
+                
+        #cosmetic changes to column names
+        self.df_obj = self._renameTeams(self.df_obj)
+        
+        if compact:
+            self.df_obj = compactObjectives(self.df_obj)
         
         return self.df_obj
             
@@ -168,6 +1212,8 @@ class WardFinder:
                 s_log['match_id'] = row.match_id #match id not unique
                 s_log['start_time'] = row.start_time #record start time
                 s_log['hero_id'] = row.hero_id #hero that placed it
+                if hasattr(row, 'account_id'):
+                    s_log['account_id'] = row.account_id #player that placed it
                 s_log['time'] = d['time'] #time of placement
                 s_log['x'] = d['x'] #x coord
                 s_log['y'] = d['y'] #y coord
@@ -201,6 +1247,8 @@ class WardFinder:
                 o_log['match_id'] = row.match_id #match id not unique
                 o_log['start_time'] = row.start_time #record start time
                 o_log['hero_id'] = row.hero_id #hero that placed it
+                if hasattr(row, 'account_id'):
+                    o_log['account_id'] = row.account_id #player that placed it
                 o_log['time'] = d['time'] #time of placement
                 o_log['x'] = d['x'] #x coord
                 o_log['y'] = d['y']
@@ -216,49 +1264,195 @@ class WardFinder:
         df_obs = pd.DataFrame.from_dict(obs_log)
         return df_obs
 
+
+    def _flattenLog(self, df, logs, counts):
+        """
+        Explode a column of ward logs into a flat dataframe without building a dict per ward.
+        
+        Parameters
+        ----------
+        df: Pandas dataframe
+            Raw match rows, must have columns 'match_id', 'start_time' and 'hero_id', 'account_id' is kept when present
+        
+        logs: array of lists
+            Ward log of each row (sen_log or obs_log)
+        
+        counts: array of int
+            Number of wards inside each log
+        """
+        #every ward in one flat list, no copy of the entries themselves
+        entries = list(chain.from_iterable(logs))
+        
+        #match level info repeated once per ward
+        d = {}
+        for col in ['match_id', 'start_time', 'hero_id', 'account_id']:
+            if col in df.columns:
+                d[col] = np.repeat(df[col].to_numpy(), counts)
+            
+        #ward level info pulled column by column
+        for col in ['time', 'x', 'y', 'z']:
+            d[col] = [e[col] for e in entries]
+            
+        #player slots below 128 belong to radiant
+        slots = np.fromiter((e['player_slot'] for e in entries), 
+                            dtype=np.int64, 
+                            count=len(entries))
+        d['is_radiant'] = (slots < 128).astype(np.int64)
         
-    def getWardData(self):
+        return pd.DataFrame(d)
+    
+    
+    def _getWards(self, df):
         """
-        Reads files inside folder and returns dataframe of observer + sentry wards. No arguments needed.
+        Extract observer and sentry activity inside dataframe in a single pass.
+        Columnar equivalent of _getObserver and _getSentry.
         """
-        #instantiate empty arrays
-        df_sen_arr = []
-        df_obs_arr = []
+        #pull both logs out once, missing logs count as empty
+        obs_logs = [x if isinstance(x, list) else [] for x in df['obs_log']]
+        sen_logs = [x if isinstance(x, list) else [] for x in df['sen_log']]
+        
+        #number of wards per row
+        obs_counts = np.fromiter(map(len, obs_logs), dtype=np.int64, count=len(obs_logs))
+        sen_counts = np.fromiter(map(len, sen_logs), dtype=np.int64, count=len(sen_logs))
+        
+        df_obs = self._flattenLog(df, obs_logs, obs_counts)
+        df_sen = self._flattenLog(df, sen_logs, sen_counts)
+        
+        return df_obs, df_sen
+
+        
+    def iterWardData(self, chunk_size: int = 10_000, seen_matches=None):
+        """
+        Generator that streams files inside folder one record at a time and yields
+        tuples of (observer, sentry) dataframes. Peak memory depends on chunk_size, not on file size.
+        
+        Parameters
+        ----------
+        chunk_size: int, default=10_000
+            Maximum number of raw records flattened at once
+            
+        seen_matches: SeenMatches, default=None
+            If given, records of matches another file already brought in are skipped before flattening
+        """
+        cols = ['match_id', 'start_time', 'hero_id', 'account_id', 'obs_log', 'sen_log']
         
         for file in self.files:
             #set the path
             data_path = os.path.join(self.folder, file)
-            #read data
-            df = pd.read_json(data_path)
-            #organize and call functions on rows
-            df_sen = self._getSentry(df)
-            df_obs = self._getObserver(df)
-            #append dataframe to respective dataframe
-            df_sen_arr.append(df_sen)
-            df_obs_arr.append(df_obs)
+            
+            for records in iterChunks(iterJsonRecords(data_path), chunk_size):
+                if seen_matches is not None:
+                    keep = seen_matches.check(file, [r['match_id'] for r in records])
+                    records = list(compress(records, keep))
+                    if not records:
+                        continue
+                #only keep what is needed to flatten
+                #account_id is optional in the source data
+                records = [{k: r.get(k) for k in cols if k in r or k != 'account_id'} for r in records]
+                df = recordsToDataframe(records)
+                yield self._getWards(df)
+                
+            if seen_matches is not None:
+                seen_matches.commit(file)
+                
+        
+    def getWardData(self, vectorized: bool = True, chunk_size: int = None, compact: bool = False, seen_matches=None):
+        """
+        Reads files inside folder and returns dataframe of observer + sentry wards.
+        
+        Parameters
+        ----------
+        vectorized: bool, default=True
+            If True explode the ward logs column by column in one pass,
+            otherwise use the legacy row by row extraction. Both give the same output.
+            
+        chunk_size: int, default=None
+            If set, stream the files with iterWardData instead of loading
+            each one whole with pd.read_json. Implies vectorized.
+            
+        compact: bool, default=False
+            If True cast the output to the compact schema, see WARD_DTYPES.
+            
+        seen_matches: SeenMatches, default=None
+            If given, rows of matches another file already brought in are dropped before flattening
+        """
+        #instantiate empty arrays
+        df_sen_arr = []
+        df_obs_arr = []
+        
+        if chunk_size is not None:
+            for df_obs, df_sen in self.iterWardData(chunk_size=chunk_size, seen_matches=seen_matches):
+                df_sen_arr.append(df_sen)
+                df_obs_arr.append(df_obs)
+            
+        else:
+            for file in self.files:
+                #set the path
+                data_path = os.path.join(self.folder, file)
+                #read data
+                with currentTimer().stage('read_json') as info:
+                    df = pd.read_json(data_path)
+                    info['rows'] = len(df)
+                if seen_matches is not None:
+                    df = df[seen_matches.check(file, df['match_id'])]
+                    seen_matches.commit(file)
+                #organize and call functions on rows
+                with currentTimer().stage('flatten_wards', rows=len(df)):
+                    if vectorized:
+                        df_obs, df_sen = self._getWards(df)
+                    else:
+                        df_sen = self._getSentry(df)
+                        df_obs = self._getObserver(df)
+                #append dataframe to respective dataframe
+                df_sen_arr.append(df_sen)
+                df_obs_arr.append(df_obs)
             
         #make into one dataframe
         self.df_sen = pd.concat(df_sen_arr)
         self.df_obs = pd.concat(df_obs_arr)
         
+        if compact:
+            self.df_sen = compactWards(self.df_sen)
+            self.df_obs = compactWards(self.df_obs)
+        
         return self.df_obs, self.df_sen
         
-    def seeObserverMap(self):
+    def spatialIndex(self, ward_type: str = 'observer', cell_size: int = 8):
         """
-        Shows a plot of all observer wards placed colored by height. Red box shows map boundaries
+        Returns a SpatialIndex over the observer or sentry wards read by getWardData.
+        
+        Parameters
+        ----------
+        ward_type: string, default='observer'
+            'observer' or 'sentry'
+            
+        cell_size: int, default=8
+            Side of a bucket in map cells
+        """
+        if ward_type not in ('observer', 'sentry'):
+            raise ValueError(f'ward_type must be "observer" or "sentry", got "{ward_type}".')
+        return SpatialIndex(self.df_obs if ward_type == 'observer' else self.df_sen, cell_size=cell_size)
+    
+    
+    def _seeWardMap(self, df, title, backend='auto'):
+        """
+        Shows a plot of the wards in df colored by height. Red box shows map boundaries
         """
-        cm = plt.cm.get_cmap('RdYlBu')
+        cm = plt.get_cmap('RdYlBu')
 
         # Create figure and axes
         fig, ax = plt.subplots()
 
-        #very messy but fun to look at
-        sc = ax.scatter(self.observerDataframe['x'],
-                   self.observerDataframe['y'], 
-                   c = self.observerDataframe['z'],
-                   cmap=cm)
+        #scatter when there are few wards, mean height per pixel otherwise
+        sc = renderPoints(ax, 
+                          df['x'].to_numpy(), 
+                          df['y'].to_numpy(), 
+                          values=df['z'].to_numpy(), 
+                          mode='mean', 
+                          cmap=cm, 
+                          backend=backend)
 
-        plt.title("Scatter of All Obsever Wards")
+        plt.title(title)
         plt.xticks(np.arange(50, 250, 50))
         plt.yticks(np.arange(50, 250, 50))
 
@@ -274,64 +1468,1717 @@ class WardFinder:
 
         plt.show()
         
+        
+    def seeObserverMap(self, backend: str = 'auto'):
+        """
+        Shows a plot of all observer wards placed colored by height. Red box shows map boundaries
+        
+        Parameters
+        ----------
+        backend: string, default='auto'
+            'scatter', 'raster', or 'auto' to rasterize above RASTER_THRESHOLD wards
+        """
+        if not hasattr(self, 'df_obs'):
+            self.getWardData()
+        self._seeWardMap(self.df_obs, "Scatter of All Obsever Wards", backend=backend)
+        
 
-    def seeSentryMap(self):
+    def seeSentryMap(self, backend: str = 'auto'):
         """
         Shows a plot of all sentry wards placed colored by height. Red box shows map boundaries
+        
+        Parameters
+        ----------
+        backend: string, default='auto'
+            'scatter', 'raster', or 'auto' to rasterize above RASTER_THRESHOLD wards
         """
-        cm = plt.cm.get_cmap('RdYlBu')
-
-        # Create figure and axes
-        fig, ax = plt.subplots()
+        if not hasattr(self, 'df_sen'):
+            self.getWardData()
+        self._seeWardMap(self.df_sen, "Scatter of All Sentry Wards", backend=backend)
+        
+        
+        
+        
+        
+        
+        
+        
 
-        #very messy but fun to look at
-        sc = ax.scatter(self.sentryDataframe['x'],
-                   self.sentryDataframe['y'], 
-                   c = self.sentryDataframe['z'],
-                   cmap=cm)
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
+        
 
-        plt.title("Scatter of All Obsever Wards")
-        plt.xticks(np.arange(50, 250, 50))
-        plt.yticks(np.arange(50, 250, 50))
 
-        #draw bounding rectangle
-        rect = patches.Rectangle((64, 64), 128, 128, linewidth=1, edgecolor='r', facecolor='none')
-        # Add the patch to the Axes
-        ax.add_patch(rect)
-        #add the color bar
-        plt.colorbar(sc)
-        #
-        ax.set_facecolor('grey')
+####################################################        
+####################################################   
 
 
-        plt.show()     
+class TimeSortedWards:
+    def __init__(self, df_obs, df_sen, columns=('x', 'y', 'time')):
+        """
+        Wards split once into radiant/dire x observer/sentry partitions, each sorted by time, 
+        so a time window is two binary searches and a row slice that shares memory with the partition.
         
+        Parameters
+        ----------
+        df_obs: Pandas dataframe
+            Observer wards with columns 'time' and 'is_radiant'
+            
+        df_sen: Pandas dataframe
+            Sentry wards, same columns as df_obs
+            
+        columns: tuple, default=('x', 'y', 'time')
+            Columns kept in the partitions, None keeps them all
+        """
+        self.teams = ['radiant', 'dire']
+        self.ward_types = ['observer', 'sentry']
+        self.partitions = {}
+        self.times = {}
         
+        for ward_type, df in zip(self.ward_types, (df_obs, df_sen)):
+            radiant = df['is_radiant'].to_numpy() == 1
+            for team, rows in zip(self.teams, (radiant, ~radiant)):
+                part = df[rows] if columns is None else df.loc[rows, list(columns)]
+                part = part.sort_values('time', kind='stable').reset_index(drop=True)
+                self.partitions[(team, ward_type)] = part
+                self.times[(team, ward_type)] = part['time'].to_numpy()
+                
+                
+    def window(self, team, ward_type, t1, t2):
+        """
+        Returns the wards of one partition placed in (t1, t2], like the boolean masks of timeSeparation.
+        """
+        times = self.times[(team, ward_type)]
+        lo, hi = np.searchsorted(times, [t1, t2], side='right')
+        return self.partitions[(team, ward_type)].iloc[lo:max(lo, hi)]
+    
+    
+    def timeSeparation(self, t1=0, t2=10):
+        """
+        Store equivalent of appWardFinder.timeSeparation, returns radiant observer, 
+        dire observer, radiant sentry and dire sentry wards placed in (t1, t2].
+        """
+        return (self.window('radiant', 'observer', t1, t2), 
+                self.window('dire', 'observer', t1, t2), 
+                self.window('radiant', 'sentry', t1, t2), 
+                self.window('dire', 'sentry', t1, t2))
+    
+    
+####################################################        
+####################################################   
+
+
+class SpatialIndex:
+    def __init__(self, df, cell_size: int = 8):
+        """
+        Grid bucket index over ward coordinates with rows sorted by time inside each bucket.
+        Rectangle, radius and polygon queries only visit the buckets they overlap and
+        a time window is a binary search inside each of them.
         
+        Parameters
+        ----------
+        df: Pandas dataframe
+            Wards with columns 'x', 'y' and 'time', raw or translated coordinates
+            
+        cell_size: int, default=8
+            Side of a bucket in map cells
+        """
+        self.df = df
+        self.cell_size = cell_size
         
+        self.x = df['x'].to_numpy().astype(np.float64)
+        self.y = df['y'].to_numpy().astype(np.float64)
+        self.time = df['time'].to_numpy().astype(np.float64)
         
+        #bucket of every row
+        self.lo = np.array([self.x.min(), self.y.min()]) if len(df) else np.zeros(2)
+        bx = ((self.x - self.lo[0]) // cell_size).astype(np.int64)
+        by = ((self.y - self.lo[1]) // cell_size).astype(np.int64)
+        self.n_x = int(bx.max()) + 1 if len(df) else 1
+        self.n_y = int(by.max()) + 1 if len(df) else 1
+        bucket = bx * self.n_y + by
         
+        #rows sorted by bucket then time, bounds[b]:bounds[b+1] are the rows of bucket b
+        self.order = np.lexsort((self.time, bucket))
+        self.sorted_time = self.time[self.order]
+        self.bounds = np.zeros(self.n_x * self.n_y + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bucket, minlength=self.n_x * self.n_y), out=self.bounds[1:])
         
         
+    def _buckets(self, x0, x1, y0, y1):
+        """
+        Bucket numbers overlapping the box [x0, x1) x [y0, y1), None means unbounded.
+        """
+        cs = self.cell_size
+        bx0 = 0 if x0 is None else max(0, int((x0 - self.lo[0]) // cs))
+        bx1 = self.n_x - 1 if x1 is None else min(self.n_x - 1, int((x1 - self.lo[0]) // cs))
+        by0 = 0 if y0 is None else max(0, int((y0 - self.lo[1]) // cs))
+        by1 = self.n_y - 1 if y1 is None else min(self.n_y - 1, int((y1 - self.lo[1]) // cs))
+        if bx1 < bx0 or by1 < by0:
+            return np.empty(0, dtype=np.int64)
+        bx, by = np.meshgrid(np.arange(bx0, bx1 + 1), np.arange(by0, by1 + 1), indexing='ij')
+        return (bx * self.n_y + by).ravel()
+    
+    
+    def _candidates(self, x0, x1, y0, y1, t1=None, t2=None):
+        """
+        Row positions in the overlapping buckets whose time is in (t1, t2].
+        """
+        parts = []
+        for b in self._buckets(x0, x1, y0, y1):
+            start, end = self.bounds[b], self.bounds[b + 1]
+            if start == end:
+                continue
+            if t1 is not None:
+                start += np.searchsorted(self.sorted_time[start:end], t1, side='right')
+            if t2 is not None:
+                end = self.bounds[b] + np.searchsorted(self.sorted_time[self.bounds[b]:end], t2, side='right')
+            if start < end:
+                parts.append(self.order[start:end])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    
+    
+    def _result(self, pos, mask):
+        """
+        Rows at pos where mask holds, in the original order of the dataframe.
+        """
+        return self.df.iloc[np.sort(pos[mask])]
+    
+    
+    def rect(self, x0=None, x1=None, y0=None, y1=None, t1=None, t2=None):
+        """
+        Returns wards with x0 <= x < x1 and y0 <= y < y1 placed in (t1, t2]. None means unbounded.
+        """
+        pos = self._candidates(x0, x1, y0, y1, t1, t2)
+        x, y = self.x[pos], self.y[pos]
+        mask = np.ones(len(pos), dtype=bool)
+        if x0 is not None:
+            mask &= x >= x0
+        if x1 is not None:
+            mask &= x < x1
+        if y0 is not None:
+            mask &= y >= y0
+        if y1 is not None:
+            mask &= y < y1
+        return self._result(pos, mask)
+    
+    
+    def radius(self, cx, cy, r, t1=None, t2=None):
+        """
+        Returns wards within distance r of (cx, cy) placed in (t1, t2].
+        """
+        pos = self._candidates(cx - r, cx + r, cy - r, cy + r, t1, t2)
+        mask = (self.x[pos] - cx) ** 2 + (self.y[pos] - cy) ** 2 <= r ** 2
+        return self._result(pos, mask)
+    
+    
+    def polygon(self, vertices, t1=None, t2=None):
+        """
+        Returns wards inside the polygon given by a list of (x, y) vertices placed in (t1, t2].
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        (x0, y0), (x1, y1) = vertices.min(axis=0), vertices.max(axis=0)
+        pos = self._candidates(x0, x1, y0, y1, t1, t2)
+        mask = Path(vertices).contains_points(np.stack([self.x[pos], self.y[pos]], axis=1))
+        return self._result(pos, mask)
+    
+    
+####################################################        
+####################################################   
 
+
+class WardCube:
+    def __init__(self, df_obs, df_sen, size: int = 128):
+        """
+        Precomputed ward counts indexed by team x ward type x minute x X x Y, stored as a
+        prefix sum over minutes so that any time window is one subtraction.
+        Expects translated coordinates (0 to size-1) and time in minutes, as in appWardFinder.load_data.
+        
+        Parameters
+        ----------
+        df_obs: Pandas dataframe
+            Observer wards, must have columns 'x', 'y', 'time' and 'is_radiant'
+            
+        df_sen: Pandas dataframe
+            Sentry wards, same columns as df_obs
+            
+        size: int, default=128
+            Number of cells along each side of the map
+        """
+        self.size = size
+        #axes labels
+        self.teams = ['radiant', 'dire']
+        self.ward_types = ['observer', 'sentry']
+        
+        #minute bin m holds times in (m-1, m] so windows (t1, t2] are whole bins
+        minutes = [np.ceil(df['time'].to_numpy()).astype(np.int64) for df in (df_obs, df_sen)]
+        all_minutes = np.concatenate(minutes)
+        self.first_minute = int(all_minutes.min()) if len(all_minutes) else 0
+        last_minute = int(all_minutes.max()) if len(all_minutes) else 0
+        n_minutes = last_minute - self.first_minute + 1
+        
+        counts = np.zeros((2, 2, n_minutes, size, size), dtype=np.int32)
+        for k, (df, minute) in enumerate(zip((df_obs, df_sen), minutes)):
+            x = df['x'].to_numpy().astype(np.int64)
+            y = df['y'].to_numpy().astype(np.int64)
+            team = np.where(df['is_radiant'].to_numpy() == 1, 0, 1)
+            #wards off the map are dropped
+            on_map = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+            np.add.at(counts, 
+                      (team[on_map], k, minute[on_map] - self.first_minute, x[on_map], y[on_map]), 
+                      1)
+        
+        #prefix[:, :, i] is the sum of the first i minute bins
+        self.prefix = np.zeros((2, 2, n_minutes + 1, size, size), dtype=np.int32)
+        np.cumsum(counts, axis=2, out=self.prefix[:, :, 1:])
+        
+        
+    @classmethod
+    def fromPrefix(cls, prefix, first_minute: int):
+        """
+        Rebuilds a cube from a saved prefix array, e.g. memory mapped from a snapshot, without copying it.
+        """
+        cube = cls.__new__(cls)
+        cube.size = prefix.shape[-1]
+        cube.teams = ['radiant', 'dire']
+        cube.ward_types = ['observer', 'sentry']
+        cube.first_minute = int(first_minute)
+        cube.prefix = prefix
+        return cube
+    
+    
+    def _index(self, t):
+        """
+        Position in the prefix axis of all bins up to minute t.
+        """
+        return int(np.clip(np.floor(t) - self.first_minute + 1, 0, self.prefix.shape[2] - 1))
         
         
+    def window(self, t1, t2):
+        """
+        Returns ward counts of shape (team, ward type, size, size) for times in (t1, t2] minutes.
+        Exact for whole minutes, fractional bounds are floored.
+        """
+        i1, i2 = self._index(t1), self._index(t2)
+        if i2 <= i1:
+            return np.zeros(self.prefix.shape[:2] + self.prefix.shape[3:], dtype=np.int32)
+        return self.prefix[:, :, i2] - self.prefix[:, :, i1]
+    
+    
+    def cells(self, grid):
+        """
+        Converts a (size, size) count grid into a dataframe of occupied cells with columns 'x', 'y', 'count'.
+        """
+        x, y = np.nonzero(grid)
+        return pd.DataFrame({'x': x, 'y': y, 'count': grid[x, y]})
+    
+    
+    def timeSeparation(self, t1=0, t2=10):
+        """
+        Cube equivalent of appWardFinder.timeSeparation, returns occupied cells for
+        radiant observer, dire observer, radiant sentry and dire sentry in (t1, t2].
+        """
+        counts = self.window(t1, t2)
+        return (self.cells(counts[0, 0]), 
+                self.cells(counts[1, 0]), 
+                self.cells(counts[0, 1]), 
+                self.cells(counts[1, 1]))
+    
+    
+####################################################        
+####################################################   
+
+
+#vision radius in map cells, 1400 and 900 units on a 20_000 unit map of 128 cells
+OBSERVER_RADIUS = 1400*128/20_000
+SENTRY_RADIUS = 900*128/20_000
+#colors of each team
+TEAM_COLORS = {'radiant': 'lime', 'dire': 'crimson'}
+
+
+#above this many points renderPoints draws an image instead of a scatter
+RASTER_THRESHOLD = 5_000
+
+
+def rasterize(x, y, values=None, mode='count', extent=None, resolution: int = 256):
+    """
+    Aggregates points into a (resolution, resolution) image indexed by [row, column] with row 0 at the
+    bottom, so the cost depends on the number of pixels and one pass over the points.
+    Pixels without points are NaN.
+    
+    Parameters
+    ----------
+    x, y: numpy arrays
+        Coordinates of every point
         
+    values: numpy array, default=None
+        Per point values for 'mean' (e.g. z) and 'label' (cluster labels, negative is noise)
         
+    mode: string, default='count'
+        'count' of points, 'mean' of values, or the most frequent non noise 'label'
         
+    extent: tuple, default=None
+        (x0, x1, y0, y1) covered by the image, the bounds of the points when None
         
+    resolution: int, default=256
+        Pixels along each side
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if extent is None:
+        extent = (x.min(), x.max() + 1, y.min(), y.max() + 1) if len(x) else (0, 1, 0, 1)
+    x0, x1, y0, y1 = extent
+    
+    col = np.floor((x - x0) / (x1 - x0) * resolution).astype(np.int64)
+    row = np.floor((y - y0) / (y1 - y0) * resolution).astype(np.int64)
+    inside = (col >= 0) & (col < resolution) & (row >= 0) & (row < resolution)
+    pixel = row[inside] * resolution + col[inside]
+    n_pixels = resolution * resolution
+    
+    if mode == 'count':
+        image = np.bincount(pixel, minlength=n_pixels).astype(np.float64)
+        image[image == 0] = np.nan
+    elif mode == 'mean':
+        values = np.asarray(values, dtype=np.float64)[inside]
+        counts = np.bincount(pixel, minlength=n_pixels)
+        sums = np.bincount(pixel, weights=values, minlength=n_pixels)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            image = np.where(counts > 0, sums / counts, np.nan)
+    elif mode == 'label':
+        labels = np.asarray(values, dtype=np.int64)[inside]
+        clustered = labels >= 0
+        pixel, labels = pixel[clustered], labels[clustered]
+        n_labels = int(labels.max()) + 1 if len(labels) else 1
+        #votes per pixel and label, the most frequent label wins with ties to the lower label
+        votes = np.bincount(pixel * n_labels + labels, minlength=n_pixels * n_labels).reshape(n_pixels, n_labels)
+        image = votes.argmax(axis=1).astype(np.float64)
+        image[votes.sum(axis=1) == 0] = np.nan
+    else:
+        raise ValueError(f'mode must be "count", "mean" or "label", got "{mode}".')
+    
+    return image.reshape(resolution, resolution)
+
+
+def renderPoints(ax, x, y, values=None, mode='count', extent=None, resolution: int = 256, 
+                 cmap=None, vmin=None, vmax=None, backend='auto', **scatter_kwargs):
+    """
+    Draws points on a pyplot axis either as a scatter or as an image from rasterize, and returns 
+    the artist for a colorbar. Empty pixels are transparent so the image composites onto a background map.
+    
+    Parameters
+    ----------
+    ax: pyplot object
+        Axis to draw on
         
+    backend: string, default='auto'
+        'scatter', 'raster', or 'auto' to rasterize above RASTER_THRESHOLD points
         
+    Other parameters are those of rasterize, cmap, vmin and vmax color both backends.
+    """
+    if backend == 'auto':
+        backend = 'raster' if len(x) > RASTER_THRESHOLD else 'scatter'
+    
+    if backend == 'scatter':
+        if mode == 'count':
+            values = None
+        return ax.scatter(x, y, c=values, cmap=cmap, vmin=vmin, vmax=vmax, **scatter_kwargs)
+    if backend != 'raster':
+        raise ValueError(f'backend must be "scatter", "raster" or "auto", got "{backend}".')
+    
+    if extent is None:
+        extent = (np.min(x), np.max(x) + 1, np.min(y), np.max(y) + 1) if len(x) else (0, 1, 0, 1)
+    image = rasterize(x, y, values=values, mode=mode, extent=extent, resolution=resolution)
+    artist = ax.imshow(np.ma.masked_invalid(image), 
+                       origin='lower', 
+                       extent=extent, 
+                       cmap=cmap, 
+                       vmin=vmin, 
+                       vmax=vmax, 
+                       interpolation='nearest')
+    return artist
+
+
+def clusterCentroids(df, eps=3, min_fraction=0.01):
+    """
+    Returns the centroids of the clusters found in a ward subdivision, in translated coordinates.
+    
+    Parameters
+    ----------
+    df: Pandas dataframe
+        Wards with raw coordinates in columns 'x' and 'y'
         
+    eps: float, default=3
+        DBSCAN radius in cells
         
+    min_fraction: float, default=0.01
+        DBSCAN min_samples as a fraction of the wards in df, at least 10
+    """
+    xy = np.stack([df['x'].to_numpy().astype(np.int16) - 64, 
+                   df['y'].to_numpy().astype(np.int16) - 64], axis=1)
+    min_samples = max(10, int(min_fraction * len(xy)))
+    labels = gridDBSCAN(xy, eps=eps, min_samples=min_samples)
+    
+    clustered = labels >= 0
+    if not clustered.any():
+        return np.empty((0, 2))
+    counts = np.bincount(labels[clustered])
+    cx = np.bincount(labels[clustered], weights=xy[clustered, 0]) / counts
+    cy = np.bincount(labels[clustered], weights=xy[clustered, 1]) / counts
+    return np.stack([cx, cy], axis=1)[counts > 0]
+
+
+def drawWardClusters(ax, df_obs, df_sen, map_img='maps/map_detailed_723.jpeg', title=None, eps=3, min_fraction=0.01):
+    """
+    Draws the observer and sentry cluster centroids of each team as vision circles on a pyplot axis.
+    Observers are filled, sentries are outlined.
+    
+    Parameters
+    ----------
+    ax: pyplot object
+        Axis to draw on
         
+    df_obs: Pandas dataframe
+        Observer wards with raw coordinates and an 'is_radiant' column
         
+    df_sen: Pandas dataframe
+        Sentry wards, same columns as df_obs
         
+    map_img: string, default='maps/map_detailed_723.jpeg'
+        Background map
         
+    title: string, default=None
+        Title of the axis
+    """
+    ax.imshow(Image.open(map_img), extent=[0, 128, 0, 128])
+    
+    for df, radius, fill in ((df_obs, OBSERVER_RADIUS, True), 
+                             (df_sen, SENTRY_RADIUS, False)):
+        for team, color in TEAM_COLORS.items():
+            df_team = df[df['is_radiant'] == (team == 'radiant')]
+            for x, y in clusterCentroids(df_team, eps=eps, min_fraction=min_fraction):
+                ax.add_patch(plt.Circle((x, y), 
+                                        radius, 
+                                        color=color, 
+                                        fill=fill, 
+                                        alpha=0.4 if fill else 0.9, 
+                                        linewidth=2))
+    ax.set_xlim(0, 128)
+    ax.set_ylim(0, 128)
+    ax.set_axis_off()
+    if title is not None:
+        ax.set_title(title)
         
         
+def saveWardMap(path, df_obs, df_sen, map_img='maps/map_detailed_723.jpeg', title=None, eps=3, min_fraction=0.01):
+    """
+    Renders drawWardClusters to a PNG file.
+    """
+    fig, ax = plt.subplots(figsize=(8, 8))
+    drawWardClusters(ax, 
+                     df_obs, 
+                     df_sen, 
+                     map_img=map_img, 
+                     title=title, 
+                     eps=eps, 
+                     min_fraction=min_fraction)
+    fig.savefig(path, bbox_inches='tight', dpi=90)
+    plt.close(fig)
+    
+    
+####################################################        
+####################################################   
+
+
+#ward lifetimes in minutes, observer and sentry
+WARD_LIFETIMES = (6, 7)
+
+
+def diskKernel(radius):
+    """
+    Returns a square 0/1 kernel marking the cells whose centers are within radius of the middle cell.
+    """
+    r = int(np.floor(radius))
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    return (dx ** 2 + dy ** 2 <= radius ** 2).astype(np.float64)
+
+
+class VisionCoverage:
+    def __init__(self, cube, radii=(OBSERVER_RADIUS, SENTRY_RADIUS)):
+        """
+        Vision coverage rasters built from a WardCube. Ward counts are convolved with the vision
+        disk of each ward type through an FFT, so a cell's value is the number of wards that see it.
+        Any number of grids, e.g. every minute of the game, is convolved in one batch.
         
+        Parameters
+        ----------
+        cube: WardCube
+            Ward counts in translated coordinates and minutes
+            
+        radii: tuple, default=(OBSERVER_RADIUS, SENTRY_RADIUS)
+            Vision radius in cells of observers and sentries
+        """
+        self.cube = cube
+        self.size = cube.size
+        self.radii = radii
         
+        #kernels padded so that the circular FFT product equals the linear convolution
+        self.pad = max(int(np.floor(r)) for r in radii)
+        self.shape = (self.size + 2 * self.pad, self.size + 2 * self.pad)
+        self.kernels = np.stack([np.fft.rfft2(diskKernel(r), s=self.shape) for r in radii])
         
         
-        
\ No newline at end of file
+    def convolve(self, counts):
+        """
+        Returns the coverage of count grids of shape (..., ward type, size, size), same shape as counts.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        full = np.fft.irfft2(np.fft.rfft2(counts, s=self.shape) * self.kernels, s=self.shape)
+        #each kernel is centered on its middle cell, shift the result back onto the map
+        out = np.empty(counts.shape, dtype=np.int32)
+        for k, radius in enumerate(self.radii):
+            r = int(np.floor(radius))
+            out[..., k, :, :] = np.rint(full[..., k, r:r + self.size, r:r + self.size])
+        return out
+    
+    
+    def window(self, t1, t2):
+        """
+        Returns the coverage of shape (team, ward type, size, size) of the wards placed in (t1, t2] minutes.
+        """
+        return self.convolve(self.cube.window(t1, t2))
+    
+    
+    def minutes(self, lifetimes=WARD_LIFETIMES):
+        """
+        Returns the coverage of every minute at once, counting the wards still alive at the end of the
+        minute, as an array of shape (team, ward type, minute, size, size) along with the minutes.
+        
+        Parameters
+        ----------
+        lifetimes: tuple, default=WARD_LIFETIMES
+            How many minutes observers and sentries stay on the map
+        """
+        prefix = self.cube.prefix
+        n_minutes = prefix.shape[2] - 1
+        end = np.arange(1, n_minutes + 1)
+        alive = np.empty((2, 2, n_minutes, self.size, self.size), dtype=np.int32)
+        for k, lifetime in enumerate(lifetimes):
+            start = np.maximum(end - lifetime, 0)
+            alive[:, k] = prefix[:, k, end] - prefix[:, k, start]
+        
+        #move the minute axis out of the way of the per type kernels
+        coverage = self.convolve(alive.transpose(0, 2, 1, 3, 4)).transpose(0, 2, 1, 3, 4)
+        return coverage, self.cube.first_minute + np.arange(n_minutes)
+    
+    
+    @staticmethod
+    def covered(coverage, threshold: int = 1):
+        """
+        Returns a boolean raster of the cells seen by at least threshold wards.
+        """
+        return coverage >= threshold
+    
+    
+    @staticmethod
+    def overlay(ax, raster, color='lime', map_img='maps/map_detailed_723.jpeg', alpha=0.5):
+        """
+        Draws a (size, size) raster indexed by [x, y] over the map, zero cells are transparent.
+        
+        Parameters
+        ----------
+        ax: pyplot object
+            Axis to draw on
+            
+        raster: numpy array
+            Coverage, boolean mask or a diff of two coverages
+            
+        color: string, default='lime'
+            Color of covered cells
+            
+        map_img: string, default='maps/map_detailed_723.jpeg'
+            Background map, None to draw on the current axis content
+            
+        alpha: float, default=0.5
+            Opacity of the strongest cell
+        """
+        size = raster.shape[0]
+        if map_img is not None:
+            ax.imshow(Image.open(map_img), extent=[0, size, 0, size])
+        values = np.abs(raster.astype(np.float64))
+        top = values.max()
+        rgba = np.zeros(values.shape + (4,))
+        rgba[..., :3] = plt.matplotlib.colors.to_rgb(color)
+        rgba[..., 3] = alpha * values / top if top > 0 else 0
+        #rasters are [x, y], images are [row, column] from the top
+        ax.imshow(rgba.transpose(1, 0, 2), origin='lower', extent=[0, size, 0, size])
+        ax.set_xlim(0, size)
+        ax.set_ylim(0, size)
+        ax.set_axis_off()
+    
+    
+class ComboRenderer:
+    def __init__(self, 
+                 df_obs, 
+                 df_sen, 
+                 map_img: str = 'maps/map_detailed_723.jpeg',
+                 cache_dir: str = '.render_cache',
+                 max_cache_bytes: int = 200 * 2**20,
+                 min_wards: int = 100,
+                 eps: float = 3,
+                 min_fraction: float = 0.01):
+        """
+        Renders the warding map of a tower combo from the ward data itself and keeps
+        the PNGs in a size bounded on-disk cache keyed by combo and data version.
+        
+        Parameters
+        ----------
+        df_obs: Pandas dataframe
+            Observer wards as returned by MatchFinder.getData, with raw coordinates and a 'combo' column
+            
+        df_sen: Pandas dataframe
+            Sentry wards, same columns as df_obs
+            
+        map_img: string, default='maps/map_detailed_723.jpeg'
+            Background map
+            
+        cache_dir: string, default='.render_cache'
+            Folder holding the rendered PNGs
+            
+        max_cache_bytes: int, default=200 MB
+            Least recently used renders are deleted above this size
+            
+        min_wards: int, default=100
+            Combos with fewer observer or sentry wards than this are invalid
+            
+        eps: float, default=3
+            DBSCAN radius in cells
+            
+        min_fraction: float, default=0.01
+            DBSCAN min_samples as a fraction of the wards in each team/type subdivision
+        """
+        self.map_img = map_img
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.min_wards = min_wards
+        self.eps = eps
+        self.min_fraction = min_fraction
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        self.obs_index = ComboIndex(df_obs)
+        self.sen_index = ComboIndex(df_sen)
+        
+        #O(1) validity lookup, indexed by combo code
+        obs_counts = np.diff(self.obs_index.bounds)
+        sen_counts = np.diff(self.sen_index.bounds)
+        self.valid = (obs_counts >= min_wards) & (sen_counts >= min_wards)
+        
+        #any change in the wards or in the rendering parameters gives a new version
+        h = hashlib.sha1()
+        for df in (df_obs, df_sen):
+            h.update(np.int64(pd.util.hash_pandas_object(df[['x', 'y', 'time', 'is_radiant', 'combo']], 
+                                                         index=False).sum()).tobytes())
+        h.update(repr((map_img, min_wards, eps, min_fraction)).encode())
+        self.data_version = h.hexdigest()[:12]
+        
+        
+    def isValid(self, combo):
+        """
+        True if there are enough wards to render a combo, given as a code or a name.
+        """
+        code = comboFromName(combo) if isinstance(combo, str) else int(combo)
+        return bool(self.valid[code])
+    
+    
+    def invalidCombos(self):
+        """
+        Returns the sorted names of every invalid combo.
+        """
+        return [comboName(code) for code in np.flatnonzero(~self.valid)]
+    
+    
+    def drawCombo(self, combo, ax):
+        """
+        Draws the observer and sentry cluster centroids of each team for a combo on a pyplot axis.
+        """
+        name = combo if isinstance(combo, str) else comboName(combo)
+        drawWardClusters(ax, 
+                         self.obs_index.get(name), 
+                         self.sen_index.get(name), 
+                         map_img=self.map_img, 
+                         title=name, 
+                         eps=self.eps, 
+                         min_fraction=self.min_fraction)
+        
+        
+    def _evict(self):
+        """
+        Deletes least recently used renders until the cache fits in max_cache_bytes.
+        """
+        paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.png')]
+        paths.sort(key=lambda p: os.stat(p).st_mtime)
+        total = sum(os.path.getsize(p) for p in paths)
+        for p in paths:
+            if total <= self.max_cache_bytes:
+                break
+            total -= os.path.getsize(p)
+            os.remove(p)
+            
+            
+    def render(self, combo):
+        """
+        Returns the path of the PNG map of a combo, rendering it only if it is not cached yet.
+        Raises ValueError for invalid combos.
+        """
+        name = combo if isinstance(combo, str) else comboName(combo)
+        if not self.isValid(name):
+            raise ValueError(f'Not enough wards for combo "{name}".')
+            
+        path = os.path.join(self.cache_dir, f'{self.data_version}_{name}.png')
+        if os.path.exists(path):
+            #mark as recently used
+            os.utime(path)
+            return path
+        
+        with currentTimer().stage('render', rows=self.obs_index.count(name) + self.sen_index.count(name)):
+            saveWardMap(path, 
+                        self.obs_index.get(name), 
+                        self.sen_index.get(name), 
+                        map_img=self.map_img, 
+                        title=name, 
+                        eps=self.eps, 
+                        min_fraction=self.min_fraction)
+        
+        self._evict()
+        return path
+    
+    
+####################################################        
+####################################################   
+
+
+class ClusterCache:
+    def __init__(self, maxsize: int = 256):
+        """
+        Bounded memo of clustering results with least recently used eviction.
+        Keys are typically (team, ward type, t1, t2, eps, min_samples).
+        
+        Parameters
+        ----------
+        maxsize: int, default=256
+            Maximum number of results kept, the least recently used one is dropped first
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        #one instance is shared by every Streamlit session, each in its own thread
+        self._lock = threading.Lock()
+        
+        
+    def get(self, key):
+        """
+        Returns the cached value for key or None, and counts the hit or miss.
+        """
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                #mark as most recently used
+                self._data.move_to_end(key)
+                return self._data[key]
+            
+            self.misses += 1
+            return None
+    
+    
+    def put(self, key, value):
+        """
+        Stores value under key and evicts the least recently used entries above maxsize.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            
+            
+    def __contains__(self, key):
+        """
+        Checks for key without counting a hit or miss.
+        """
+        with self._lock:
+            return key in self._data
+    
+    
+    def info(self):
+        """
+        Returns a dict of hits, misses, current size and maxsize.
+        """
+        with self._lock:
+            return {'hits': self.hits, 
+                    'misses': self.misses, 
+                    'size': len(self._data), 
+                    'maxsize': self.maxsize}
+    
+    
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+        
+        
+####################################################        
+####################################################   
+
+
+class SeenMatches:
+    def __init__(self, path: str = None):
+        """
+        Persistent index of the match ids already ingested, kept as a sorted array with the file
+        that first brought in each match. Rows of a match that an earlier file owns are duplicates
+        from overlapping export windows, rows of a file's own matches are always kept, so ingesting
+        the same folder twice gives the same result.
+        
+        Parameters
+        ----------
+        path: string, default=None
+            .npz file the index is loaded from and saved to after every file, kept in memory only when None
+        """
+        self.path = path
+        self.ids = np.empty(0, dtype=np.int64)
+        self.owner = np.empty(0, dtype=np.int32)
+        self.files = []
+        #new and duplicate match ids of files being read
+        self._pending = {}
+        self.stats = OrderedDict()
+        
+        if path is not None and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as f:
+                self.ids = f['ids']
+                self.owner = f['owner']
+                self.files = f['files'].tolist()
+                
+                
+    def _fileIndex(self, file):
+        if file not in self.files:
+            self.files.append(file)
+        return self.files.index(file)
+    
+    
+    def check(self, file, match_ids, unit: str = 'rows'):
+        """
+        Returns a boolean mask of the rows to keep, False for rows of matches owned by another file.
+        Can be called several times per file, e.g. once per streamed chunk, before commit.
+        
+        Parameters
+        ----------
+        file: string
+            Name of the file the rows come from
+            
+        match_ids: array
+            Match id of every row
+            
+        unit: string, default='rows'
+            What one entry of match_ids stands for, 'rows' of the raw file or 'matches' of a
+            parsed table, recorded with the counts so that the report says what was counted
+        """
+        match_ids = np.asarray(match_ids, dtype=np.int64)
+        owner = self._fileIndex(file)
+        
+        pos = np.searchsorted(self.ids, match_ids)
+        found = pos < len(self.ids)
+        found[found] = self.ids[pos[found]] == match_ids[found]
+        duplicate = found.copy()
+        duplicate[found] = self.owner[pos[found]] != owner
+        
+        new, dups = self._pending.setdefault(file, ([], []))
+        new.append(np.unique(match_ids[~found]))
+        dups.append(np.unique(match_ids[duplicate]))
+        stats = self.stats.setdefault(file, {'unit': unit, 'checked': 0, 'dropped': 0, 'duplicate_matches': 0})
+        stats['checked'] += len(match_ids)
+        stats['dropped'] += int(duplicate.sum())
+        return ~duplicate
+    
+    
+    def commit(self, file):
+        """
+        Adds the new matches of a fully read file to the index and saves it.
+        """
+        new, dups = self._pending.pop(file, ([], []))
+        if dups:
+            self.stats[file]['duplicate_matches'] = len(np.unique(np.concatenate(dups)))
+        if new:
+            new = np.unique(np.concatenate(new))
+            ids = np.concatenate([self.ids, new])
+            owner = np.concatenate([self.owner, np.full(len(new), self._fileIndex(file), dtype=np.int32)])
+            order = np.argsort(ids, kind='stable')
+            self.ids, self.owner = ids[order], owner[order]
+        if self.path is not None:
+            np.savez(self.path, ids=self.ids, owner=self.owner, files=np.array(self.files, dtype=str))
+            
+            
+    def report(self):
+        """
+        Returns per file of this session what was checked and dropped, counted in 'unit', 
+        and the number of duplicate matches.
+        """
+        return pd.DataFrame.from_dict(self.stats, 
+                                      orient='index', 
+                                      columns=['unit', 'checked', 'dropped', 'duplicate_matches'])
+    
+    
+class ShardCache:
+    #bump whenever the layout of the cached tables changes
+    version = 2
+    
+    def __init__(self, cache_dir: str = '.ward_cache'):
+        """
+        On-disk columnar cache of ingested tables, one .npz shard per table and source file.
+        A shard is keyed by the size, mtime and content hash of its source file.
+        
+        Parameters
+        ----------
+        cache_dir: string, default='.ward_cache'
+            Folder holding the shards and the manifest
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        self.manifest_path = os.path.join(self.cache_dir, 'manifest.json')
+        self.manifest = {'version': self.version, 'files': {}}
+        
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            #stale layouts are ignored and rebuilt
+            if manifest.get('version') == self.version:
+                self.manifest = manifest
+                
+                
+    def _hashFile(self, path):
+        """
+        Returns the sha1 hex digest of a file, read in blocks.
+        """
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+    
+    
+    def _shardPath(self, digest, name):
+        return os.path.join(self.cache_dir, f'{digest}_{name}.npz')
+    
+    
+    def lookup(self, path, names):
+        """
+        Returns the key of a source file and its cached tables, or None if they must be rebuilt.
+        The content hash is only computed when size or mtime changed.
+        
+        Parameters
+        ----------
+        path: string
+            Path of the source file
+            
+        names: list of strings
+            Names of the tables expected in the shard
+        """
+        st = os.stat(path)
+        key = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+        entry = self.manifest['files'].get(os.path.abspath(path))
+        
+        if entry is not None and (entry['size'], entry['mtime']) == (key['size'], key['mtime']):
+            key['hash'] = entry['hash']
+        else:
+            #file was touched or is new, trust the content only
+            key['hash'] = self._hashFile(path)
+            
+        shard_paths = [self._shardPath(key['hash'], name) for name in names]
+        if not all(os.path.exists(p) for p in shard_paths):
+            return key, None
+        
+        #content unchanged, refresh size and mtime
+        self.manifest['files'][os.path.abspath(path)] = key
+        
+        tables = []
+        for p in shard_paths:
+            with np.load(p, allow_pickle=False) as shard:
+                tables.append(pd.DataFrame({col: shard[col] for col in shard.files}))
+        return key, tables
+    
+    
+    def store(self, path, key, tables, names):
+        """
+        Writes the tables of a source file to the cache and drops the shards of its previous content.
+        
+        Parameters
+        ----------
+        path: string
+            Path of the source file
+            
+        key: dict
+            Key returned by lookup
+            
+        tables: list of Pandas dataframes
+            Tables to cache, columns must not have object dtype
+            
+        names: list of strings
+            Name of each table
+        """
+        for df, name in zip(tables, names):
+            np.savez(self._shardPath(key['hash'], name), 
+                     **{str(col): df[col].to_numpy() for col in df.columns})
+            
+        old = self.manifest['files'].get(os.path.abspath(path))
+        self.manifest['files'][os.path.abspath(path)] = key
+        
+        #remove shards no other source file points to
+        if old is not None and old['hash'] != key['hash']:
+            if all(e['hash'] != old['hash'] for e in self.manifest['files'].values()):
+                for name in names:
+                    if os.path.exists(self._shardPath(old['hash'], name)):
+                        os.remove(self._shardPath(old['hash'], name))
+                        
+                        
+    def save(self):
+        """
+        Writes the manifest to disk.
+        """
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f)
+            
+            
+def saveSnapshot(folder, arrays, meta=None):
+    """
+    Writes a dictionary of numpy arrays as one .npy file each plus a meta.json, so that 
+    loadSnapshot can memory map them instead of reading and parsing.
+    
+    Parameters
+    ----------
+    folder: string
+        Output folder, created if needed
+        
+    arrays: dict
+        Name to numpy array, names are used as file names
+        
+    meta: dict, default=None
+        Anything JSON serializable to keep along
+    """
+    os.makedirs(folder, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(folder, name + '.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump({'arrays': sorted(arrays), 'meta': meta or {}}, f, indent=1)
+        
+        
+def loadSnapshot(folder, mmap: bool = True):
+    """
+    Returns the arrays and meta written by saveSnapshot. Arrays are read only memory maps
+    unless mmap is False, so loading costs next to nothing until the pages are touched.
+    """
+    with open(os.path.join(folder, 'meta.json')) as f:
+        content = json.load(f)
+    arrays = {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode='r' if mmap else None) 
+              for name in content['arrays']}
+    return arrays, content['meta']
+
+
+####################################################        
+####################################################   
+
+
+class MatchFinder(ObjectiveFinder, WardFinder):
+    def __init__(self, folder: str ='data_obj'):
+        """
+        Perform query over JSON folders from OpenDota and extract objectives, observer & sentry wards
+        while reading each file only once. All files inside data folder MUST BE JSON FILES
+        
+        Parameters
+        ----------
+        folder: string, default= 'data_obj'
+                The folder containing the JSON data files
+        """
+        super().__init__(folder=folder)
+        #sorted so that results are merged in the same order on every run
+        self.files = sorted(self.files)
+        
+        
+    def _getFileData(self, file):
+        """
+        Reads one file and returns its objectives, observer and sentry dataframes.
+        """
+        #set the path
+        data_path = os.path.join(self.folder, file)
+        #read data once for both passes
+        df = pd.read_json(data_path)
+        
+        df_obj = self._getObjectiveDataframe(df)
+        df_obs, df_sen = self._getWards(df)
+        
+        return df_obj, df_obs, df_sen
+    
+    
+    def updateProfiles(self, profiles):
+        """
+        Counts the files that are not in the profiles yet into them and returns them.
+        Each file is read once for every WardProfiles given, e.g. one by hero and one by player.
+        
+        Parameters
+        ----------
+        profiles: WardProfiles or list of WardProfiles
+            Profiles to bring up to date with the folder
+        """
+        if isinstance(profiles, WardProfiles):
+            profiles = [profiles]
+        for file in sorted(self.files):
+            missing = [p for p in profiles if file not in p.shards]
+            if not missing:
+                continue
+            with currentTimer().stage('read_json') as info:
+                df = pd.read_json(os.path.join(self.folder, file))
+                info['rows'] = len(df)
+            df_obs, df_sen = self._getWards(df)
+            for p in missing:
+                p.update(df_obs, df_sen, shard=file)
+        return profiles[0] if len(profiles) == 1 else profiles
+    
+    
+    def getData(self, n_jobs: int = 1, cache_dir: str = None, compact: bool = False, combos: bool = True, seen_matches=None):
+        """
+        Reads files inside folder and returns dataframes of objectives, observer and sentry wards.
+        
+        Parameters
+        ----------
+        n_jobs: int, default=1
+            Number of worker processes used to read files. -1 means using all processors.
+            Output order is the sorted file order regardless of n_jobs.
+            
+        cache_dir: string, default=None
+            If set, keep a ShardCache in this folder and only parse files that are new or changed.
+            
+        compact: bool, default=False
+            If True cast the output to the compact schema, see WARD_DTYPES and compactObjectives.
+            
+        combos: bool, default=True
+            If True add a 'combo' column to the ward tables, the packed tower state of the
+            six lanes when the ward was placed (see towerStates and comboCode).
+            
+        seen_matches: SeenMatches, default=None
+            If given, matches another file already brought in are dropped from each file's tables.
+            Files are parsed (or read from the cache) first, so its report counts matches, not raw rows.
+        """
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+            
+        names = ['obj', 'obs', 'sen']
+        cache = ShardCache(cache_dir) if cache_dir is not None else None
+        
+        #look up every file, only misses get parsed
+        results = {}
+        keys = {}
+        if cache is not None:
+            with currentTimer().stage('cache_lookup', rows=len(self.files)):
+                for file in self.files:
+                    keys[file], tables = cache.lookup(os.path.join(self.folder, file), names)
+                    if tables is not None:
+                        results[file] = tables
+        misses = [file for file in self.files if file not in results]
+        
+        with currentTimer().stage('parse', rows=len(misses)):
+            if n_jobs == 1 or len(misses) < 2:
+                parsed = [self._getFileData(file) for file in misses]
+            else:
+                #map keeps the input order so the merge is deterministic
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    parsed = list(executor.map(self._getFileData, misses))
+                
+        with currentTimer().stage('cache_store', rows=len(misses)):
+            for file, tables in zip(misses, parsed):
+                results[file] = tables
+                if cache is not None:
+                    cache.store(os.path.join(self.folder, file), keys[file], tables, names)
+
+            if cache is not None:
+                cache.save()
+                
+        if seen_matches is not None:
+            with currentTimer().stage('dedup', rows=len(self.files)):
+                for file in self.files:
+                    df_obj, df_obs, df_sen = results[file]
+                    keep = seen_matches.check(file, df_obj['match_id'], unit='matches')
+                    seen_matches.commit(file)
+                    if not keep.all():
+                        kept = df_obj['match_id'].to_numpy()[keep]
+                        results[file] = (df_obj[keep], 
+                                         df_obs[df_obs['match_id'].isin(kept)], 
+                                         df_sen[df_sen['match_id'].isin(kept)])
+                    
+        df_obj_arr, df_obs_arr, df_sen_arr = zip(*[results[file] for file in self.files])
+        
+        #make into one dataframe
+        with currentTimer().stage('concat') as info:
+            self.df_obj = self._renameTeams(pd.concat(df_obj_arr))
+            self.df_obs = pd.concat(df_obs_arr)
+            self.df_sen = pd.concat(df_sen_arr)
+            info['rows'] = len(self.df_obs) + len(self.df_sen)
+        
+        if combos:
+            with currentTimer().stage('tower_states', rows=len(self.df_obs) + len(self.df_sen)):
+                self.df_obs['combo'] = comboCode(towerStates(self.df_obs, self.df_obj))
+                self.df_sen['combo'] = comboCode(towerStates(self.df_sen, self.df_obj))
+        
+        if compact:
+            with currentTimer().stage('compact', rows=len(self.df_obs) + len(self.df_sen)):
+                self.df_obj = compactObjectives(self.df_obj)
+                self.df_obs = compactWards(self.df_obs)
+                self.df_sen = compactWards(self.df_sen)
+        
+        return self.df_obj, self.df_obs, self.df_sen
+
+
+####################################################        
+####################################################   
+
+
+class MergedView:
+    def __init__(self, store, ward_type):
+        """
+        Lazy stand-in for the wide ward + objectives merge of notebook 05 (df_obs_obj / df_sen_obj).
+        Selecting columns only joins the objective columns asked for, anything else
+        materializes the full merge once and forwards to it.
+        
+        Parameters
+        ----------
+        store: MatchStore
+            Store holding the normalized tables
+            
+        ward_type: string
+            'observer' or 'sentry'
+        """
+        self._store = store
+        self._ward_type = ward_type
+        self._frame = None
+        
+        
+    @property
+    def frame(self):
+        """
+        The full merged dataframe, built on first access.
+        """
+        if self._frame is None:
+            self._frame = self._store.query(self._ward_type, columns=self._store.objectiveColumns())
+        return self._frame
+    
+    
+    @property
+    def columns(self):
+        return pd.Index(list(self._store.wards(self._ward_type).columns) + self._store.objectiveColumns())
+    
+    
+    def __len__(self):
+        return len(self._store.wards(self._ward_type))
+    
+    
+    def __getitem__(self, key):
+        if self._frame is None:
+            if isinstance(key, str):
+                if key in self._store.wards(self._ward_type).columns:
+                    return self._store.wards(self._ward_type)[key]
+                return self._store.query(self._ward_type, columns=[key], keep_ward_columns=False)[key]
+            if isinstance(key, list) and all(isinstance(k, str) for k in key):
+                ward_cols = [k for k in key if k in self._store.wards(self._ward_type).columns]
+                obj_cols = [k for k in key if k not in ward_cols]
+                df = self._store.query(self._ward_type, columns=obj_cols, keep_ward_columns=False)
+                for col in ward_cols:
+                    df[col] = self._store.wards(self._ward_type)[col]
+                return df[key]
+        return self.frame[key]
+    
+    
+    def __getattr__(self, name):
+        #only reached for attributes the view does not define itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.frame, name)
+    
+    
+class MatchStore:
+    def __init__(self, df_obs, df_sen, df_obj):
+        """
+        Normalized store of ward facts and per-match objectives. Objective columns are
+        joined onto wards on demand instead of being copied onto every ward row.
+        
+        Parameters
+        ----------
+        df_obs: Pandas dataframe
+            Observer wards with a 'match_id' column
+            
+        df_sen: Pandas dataframe
+            Sentry wards with a 'match_id' column
+            
+        df_obj: Pandas dataframe
+            Wide objectives table from ObjectiveFinder, one row per match is kept
+        """
+        self.df_obs = df_obs.reset_index(drop=True)
+        self.df_sen = df_sen.reset_index(drop=True)
+        #one row per match, like the left merge of notebook 05 would pick for unique ids
+        self.df_obj = df_obj.drop_duplicates(subset='match_id', keep='first').set_index('match_id')
+        
+        
+    def wards(self, ward_type):
+        """
+        Returns the ward fact table of 'observer' or 'sentry'.
+        """
+        if ward_type not in ('observer', 'sentry'):
+            raise ValueError(f'ward_type must be "observer" or "sentry", got "{ward_type}".')
+        return self.df_obs if ward_type == 'observer' else self.df_sen
+    
+    
+    def objectiveColumns(self, contains: str = None):
+        """
+        Returns the objective column names, optionally only those containing a substring
+        such as 'tower1' or 'ROSHAN'.
+        """
+        cols = list(self.df_obj.columns)
+        if contains is not None:
+            cols = [c for c in cols if contains in c]
+        return cols
+    
+    
+    def query(self, ward_type, columns=None, where=None, keep_ward_columns=True):
+        """
+        Returns wards joined with only the requested objective columns.
+        
+        Parameters
+        ----------
+        ward_type: string
+            'observer' or 'sentry'
+            
+        columns: list of strings, default=None
+            Objective columns to join, None joins none
+            
+        where: callable, default=None
+            Takes the joined dataframe and returns a boolean mask, applied before returning
+            
+        keep_ward_columns: bool, default=True
+            If False only the joined objective columns are returned
+        """
+        df_wards = self.wards(ward_type)
+        columns = [] if columns is None else list(columns)
+        
+        missing = [c for c in columns if c not in self.df_obj.columns]
+        if missing:
+            raise KeyError(f'Unknown objective columns {missing}.')
+        
+        #position of every ward's match in the objectives table, -1 if unknown
+        pos = self.df_obj.index.get_indexer(df_wards['match_id'])
+        known = pos >= 0
+        
+        df = df_wards.copy() if keep_ward_columns else pd.DataFrame(index=df_wards.index)
+        for col in columns:
+            values = self.df_obj[col].to_numpy()
+            if values.dtype.kind in 'iub':
+                values = values.astype(np.float64)
+            joined = np.full(len(df_wards), np.nan, dtype=values.dtype if values.dtype.kind == 'f' else object)
+            joined[known] = values[pos[known]]
+            df[col] = joined
+            
+        if where is not None:
+            df = df[where(df)]
+            
+        return df
+    
+    
+    def wardsAfter(self, ward_type, objective, taken: bool = True):
+        """
+        Returns wards placed after (taken=True) or before (taken=False) an objective of their match,
+        joining only that one column.
+        """
+        df = self.query(ward_type, columns=[objective])
+        mask = df['time'] > df[objective] if taken else ~(df['time'] > df[objective])
+        return df[mask]
+    
+    
+    def merged(self, ward_type):
+        """
+        Returns a lazy MergedView standing for the wide merge of wards and objectives.
+        """
+        return MergedView(self, ward_type)
+    
+    
+    def toCsv(self, folder):
+        """
+        Writes the three normalized tables to obs.csv, sen.csv and obj.csv inside folder.
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.df_obs.to_csv(os.path.join(folder, 'obs.csv'), index=False)
+        self.df_sen.to_csv(os.path.join(folder, 'sen.csv'), index=False)
+        self.df_obj.reset_index().to_csv(os.path.join(folder, 'obj.csv'), index=False)
+        
+        
+    @classmethod
+    def fromCsv(cls, folder):
+        """
+        Reads a store written by toCsv.
+        """
+        return cls(pd.read_csv(os.path.join(folder, 'obs.csv')), 
+                   pd.read_csv(os.path.join(folder, 'sen.csv')), 
+                   pd.read_csv(os.path.join(folder, 'obj.csv')))
+    
+    
+####################################################        
+####################################################   
+
+
+class WardProfiles:
+    #minute bins of the timing profiles, bin 0 holds minute -5 and earlier
+    minute_offset = 5
+    n_minutes = 256
+    
+    def __init__(self, key: str = 'hero_id', size: int = 128, offset: int = 64):
+        """
+        Ward counts per hero or player kept as sparse cubes sorted by group, one of 
+        group x ward type x cell for heatmaps and one of group x ward type x minute for timings.
+        A sorted index of the groups points at each group's slice, so a profile reads only its 
+        own entries, and new shards are merged in without recounting the old ones.
+        
+        Parameters
+        ----------
+        key: string, default='hero_id'
+            Column to group by, 'hero_id' or 'account_id'
+            
+        size: int, default=128
+            Number of cells along each side of the map
+            
+        offset: int, default=64
+            Subtracted from raw x and y to get cells, wards off the map are left out
+        """
+        self.key = key
+        self.size = size
+        self.offset = offset
+        self.ward_types = ['observer', 'sentry']
+        
+        #sorted unique groups and where each one starts in the cubes
+        self.keys = np.empty(0, dtype=np.int64)
+        self.cells = self._emptyCube(2 * size * size)
+        self.minutes = self._emptyCube(2 * self.n_minutes)
+        #names of the shards already counted
+        self.shards = set()
+        
+        
+    def _emptyCube(self, width):
+        """
+        A cube is its sorted unique codes, their counts, the start of each group and the codes per group.
+        """
+        return {'code': np.empty(0, dtype=np.int64), 
+                'count': np.empty(0, dtype=np.int64), 
+                'bounds': np.zeros(1, dtype=np.int64), 
+                'width': width}
+    
+    
+    def _encode(self, df, k):
+        """
+        Codes of the heatmap and timing cubes for the wards of one type, grouped by key then type.
+        """
+        group = pd.to_numeric(df[self.key], errors='coerce').to_numpy(dtype=np.float64)
+        x = df['x'].to_numpy().astype(np.int64) - self.offset
+        y = df['y'].to_numpy().astype(np.int64) - self.offset
+        minute = np.clip(np.floor(df['time'].to_numpy().astype(np.float64) / 60).astype(np.int64) + self.minute_offset, 
+                         0, 
+                         self.n_minutes - 1)
+        
+        #anonymous players and wards off the map are not counted
+        known = ~np.isnan(group)
+        on_map = known & (x >= 0) & (x < self.size) & (y >= 0) & (y < self.size)
+        #0 only stands in for the anonymous rows, which both masks leave out
+        group = np.where(known, group, 0).astype(np.int64)
+        
+        n_cells = self.size * self.size
+        cell_codes = (group[on_map] * 2 + k) * n_cells + x[on_map] * self.size + y[on_map]
+        minute_codes = (group[known] * 2 + k) * self.n_minutes + minute[known]
+        return cell_codes, minute_codes
+    
+    
+    def _merge(self, cube, codes):
+        """
+        Adds codes to a cube keeping it sorted and unique, and recomputes the group bounds.
+        """
+        codes, counts = np.unique(codes, return_counts=True)
+        codes = np.concatenate([cube['code'], codes])
+        counts = np.concatenate([cube['count'], counts])
+        merged, inverse = np.unique(codes, return_inverse=True)
+        cube['code'] = merged
+        cube['count'] = np.bincount(inverse.ravel(), weights=counts, minlength=len(merged)).astype(np.int64)
+        
+        
+    def update(self, df_obs, df_sen, shard=None):
+        """
+        Counts a batch of wards into the cubes. Returns False without counting if the shard
+        was already counted, shards are expected to never change once written.
+        
+        Parameters
+        ----------
+        df_obs: Pandas dataframe
+            Observer wards with raw coordinates, time in seconds and the key column
+            
+        df_sen: Pandas dataframe
+            Sentry wards, same columns as df_obs
+            
+        shard: string, default=None
+            Name of the source file, used to skip shards seen before
+        """
+        if shard is not None and shard in self.shards:
+            return False
+        
+        with currentTimer().stage('profiles_update', rows=len(df_obs) + len(df_sen)):
+            cell_codes, minute_codes = zip(*(self._encode(df, k) for k, df in enumerate((df_obs, df_sen))))
+            self._merge(self.cells, np.concatenate(cell_codes))
+            self._merge(self.minutes, np.concatenate(minute_codes))
+            
+            #sorted index of groups over both cubes
+            self.keys = np.union1d(self.cells['code'] // self.cells['width'], 
+                                   self.minutes['code'] // self.minutes['width'])
+            for cube in (self.cells, self.minutes):
+                cube['bounds'] = np.searchsorted(cube['code'], 
+                                                 np.append(self.keys, self.keys[-1] + 1) * cube['width'] if len(self.keys) else [0])
+                
+        if shard is not None:
+            self.shards.add(shard)
+        return True
+    
+    
+    def _slice(self, cube, group, ward_type):
+        """
+        Offsets within the group and counts of one group and ward type, read through the sorted index.
+        """
+        if ward_type not in self.ward_types:
+            raise ValueError(f'ward_type must be "observer" or "sentry", got "{ward_type}".')
+        i = np.searchsorted(self.keys, group)
+        if i == len(self.keys) or self.keys[i] != group:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        start, end = cube['bounds'][i], cube['bounds'][i + 1]
+        codes = cube['code'][start:end] - group * cube['width']
+        
+        #both ward types of a group are contiguous, observers first
+        half = cube['width'] // 2
+        k = self.ward_types.index(ward_type)
+        lo, hi = np.searchsorted(codes, [k * half, (k + 1) * half])
+        return codes[lo:hi] - k * half, cube['count'][start:end][lo:hi]
+    
+    
+    def heatmap(self, group, ward_type='observer'):
+        """
+        Returns the (size, size) ward counts of one hero or player indexed by [x, y].
+        """
+        cells, counts = self._slice(self.cells, group, ward_type)
+        grid = np.zeros(self.size * self.size, dtype=np.int64)
+        grid[cells] = counts
+        return grid.reshape(self.size, self.size)
+    
+    
+    def timing(self, group, ward_type='observer'):
+        """
+        Returns the number of wards placed by one hero or player in each minute as a Series indexed by minute.
+        """
+        minutes, counts = self._slice(self.minutes, group, ward_type)
+        out = np.zeros(self.n_minutes, dtype=np.int64)
+        out[minutes] = counts
+        return pd.Series(out, index=np.arange(self.n_minutes) - self.minute_offset, name='wards')
+    
+    
+    def membership(self, group, labels, ward_type='observer'):
+        """
+        Returns how many wards of one hero or player fall in each cluster.
+        
+        Parameters
+        ----------
+        group: int
+            Hero or account id
+            
+        labels: numpy array of shape (size, size)
+            Cluster label of every cell indexed by [x, y], -1 for noise
+            
+        ward_type: string, default='observer'
+            'observer' or 'sentry'
+        """
+        cells, counts = self._slice(self.cells, group, ward_type)
+        cell_labels = np.asarray(labels).ravel()[cells]
+        clustered = cell_labels >= 0
+        n_labels = int(np.max(labels)) + 1 if np.size(labels) else 0
+        return pd.Series(np.bincount(cell_labels[clustered], weights=counts[clustered], minlength=n_labels).astype(np.int64), 
+                         name='wards')
+    
+    
+    def totals(self, ward_type='observer'):
+        """
+        Returns the number of wards of every hero or player as a Series sorted by the sorted index.
+        """
+        k = self.ward_types.index(ward_type)
+        cube = self.minutes
+        groups = cube['code'] // cube['width']
+        of_type = (cube['code'] % cube['width']) // (cube['width'] // 2) == k
+        totals = np.bincount(np.searchsorted(self.keys, groups[of_type]), 
+                             weights=cube['count'][of_type], 
+                             minlength=len(self.keys)).astype(np.int64)
+        return pd.Series(totals, index=pd.Index(self.keys, name=self.key), name='wards')
+    
+    
+    def save(self, path):
+        """
+        Writes the cubes, the index and the counted shards to one .npz file.
+        """
+        np.savez(path, 
+                 keys=self.keys, 
+                 shards=np.array(sorted(self.shards), dtype=str), 
+                 meta=np.array([self.size, self.offset]), 
+                 key=np.array(self.key), 
+                 **{f'{name}_{part}': cube[part] 
+                    for name, cube in (('cells', self.cells), ('minutes', self.minutes)) 
+                    for part in ('code', 'count', 'bounds')})
+        
+        
+    @classmethod
+    def load(cls, path, key: str = None):
+        """
+        Reads profiles written by save.
+        
+        Parameters
+        ----------
+        path: string
+            .npz file written by save
+            
+        key: string, default=None
+            Column the profiles are expected to be grouped by, the saved one if None
+        """
+        with np.load(path, allow_pickle=False) as f:
+            size, offset = f['meta'].tolist()
+            saved = str(f['key'])
+            if key is not None and key != saved:
+                raise ValueError(f'{path} holds profiles grouped by {saved}, not {key}.')
+            profiles = cls(key=saved, size=size, offset=offset)
+            profiles.keys = f['keys']
+            profiles.shards = set(f['shards'].tolist())
+            for name in ('cells', 'minutes'):
+                getattr(profiles, name).update({part: f[f'{name}_{part}'] for part in ('code', 'count', 'bounds')})
+        return profiles
@@ -1,12 +1,32 @@
-import streamlit as st
-import requests
+import time
+#startup phases are timed from here
+start_time = time.perf_counter()
+
+import os
 import io
-import pandas as pd
 from io import BytesIO
+
+import streamlit as st
+import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-from sklearn.cluster import DBSCAN
+
+from HelperClasses import (compactWards, translateWards, gridDBSCAN, cellDBSCAN, WardCube, ClusterCache, 
+                           TimeSortedWards, StageTimer, LazyImport, loadSnapshot, renderPoints, RASTER_THRESHOLD, 
+                           useTimer, profilePath)
+
+#only imported once something needs them, the first page is served from the snapshot without them
+requests = LazyImport('requests')
+plt = LazyImport('matplotlib.pyplot')
+Image = LazyImport('PIL.Image')
+DBSCAN = LazyImport('sklearn.cluster', 'DBSCAN')
+ListedColormap = LazyImport('matplotlib.colors', 'ListedColormap')
+
+#prebuilt by buildSnapshot.py
+SNAPSHOT_DIR = 'snapshot'
+
+#phases of this run, always recorded
+startup = StageTimer(enabled=True)
+startup.record('imports', time.perf_counter() - start_time)
 
 
 #this line must come first
@@ -32,15 +52,18 @@ colors = [
          ]
 
 
-@st.cache(persist=True)
+@st.cache(persist=True, allow_output_mutation=True)
 def load_data():
     """
-    Loads data from public S3 bucket
+    Loads data from the local snapshot when there is one, otherwise from public S3 bucket, and builds the ward count cube
     
     """
-    #read from S3
-    df_obs = pd.read_csv('https://nadim-kawwa-dota-bucket.s3.us-west-2.amazonaws.com/df_obs.csv')
-    df_sen = pd.read_csv('https://nadim-kawwa-dota-bucket.s3.us-west-2.amazonaws.com/df_sentry.csv')
+    if os.path.isdir(SNAPSHOT_DIR):
+        return load_snapshot()
+    
+    #read from S3 and cast to the compact schema
+    df_obs = compactWards(pd.read_csv('https://nadim-kawwa-dota-bucket.s3.us-west-2.amazonaws.com/df_obs.csv'))
+    df_sen = compactWards(pd.read_csv('https://nadim-kawwa-dota-bucket.s3.us-west-2.amazonaws.com/df_sentry.csv'))
     
     
     #background image to be used
@@ -49,22 +72,36 @@ def load_data():
     img = Image.open(BytesIO(img_response.content))
     
     
-    #apply translation of coordinates
-    df_obs['x'] = df_obs['x'] - 64
-    df_obs['y'] = df_obs['y'] - 64
-    df_sen['x'] = df_sen['x'] - 64
-    df_sen['y'] = df_sen['y'] - 64
+    #apply translation of coordinates and convert time to minutes
+    translateWards(df_obs)
+    translateWards(df_sen)
 
-    #convert time to minutes
-    df_obs['time'] = df_obs['time']/60
-    df_sen['time'] = df_sen['time']/60
+    #counts per team, type, minute and cell to answer any time window
+    cube = WardCube(df_obs, df_sen)
+    
+    return df_obs, df_sen, img, cube, None
 
+
+def load_snapshot():
+    """
+    Memory maps the prebuilt snapshot, nothing is parsed or decoded
     
-    return df_obs, df_sen, img
+    """
+    arrays, meta = loadSnapshot(SNAPSHOT_DIR)
+    df_obs = pd.DataFrame({c: arrays['obs_' + c] for c in meta['columns']}, copy=False)
+    df_sen = pd.DataFrame({c: arrays['sen_' + c] for c in meta['columns']}, copy=False)
+    cube = WardCube.fromPrefix(arrays['cube'], meta['first_minute'])
+    
+    #labels of the default view, to seed the cluster cache
+    view = dict(meta['view'])
+    view['labels'] = {(team, ward_type): arrays[f'labels_{team}_{ward_type}'] 
+                      for team in cube.teams for ward_type in cube.ward_types}
+    
+    return df_obs, df_sen, arrays['map'], cube, view
 
 
 
-def getLabels(df, eps=3, min_samples=100):
+def getLabels(df, eps=3, min_samples=100, weighted=True):
     """
     Returns the labels of a dataframe after dbscan clustering
     
@@ -72,7 +109,8 @@ def getLabels(df, eps=3, min_samples=100):
     ----------
     
     df: Pandas dataframe
-        Data to be used for fitting. Must have columns 'x' and 'y'
+        Data to be used for fitting. Must have columns 'x' and 'y'.
+        If it has a 'count' column each row is a cell holding that many wards.
     
     eps : float, default=0.5
         The maximum distance between two samples for one to be considered
@@ -81,26 +119,126 @@ def getLabels(df, eps=3, min_samples=100):
         important DBSCAN parameter to choose appropriately for your data set
         and distance function.
         
+    weighted: bool, default=True
+        If True cluster the unique map cells weighted by ward count, 
+        otherwise cluster every row. Both give the same labels.
         
     
     """
-    #instantiate dbscan
-    db = DBSCAN(eps=eps, 
-                min_samples=min_samples, 
-                metric='euclidean', 
-                n_jobs=-1
-               )
-    
-    #fit and predict to data
-    db.fit_predict(df[['x', 'y']])
+    if 'count' in df.columns:
+        labels = cellDBSCAN(df[['x', 'y']].to_numpy(), 
+                            df['count'].to_numpy(), 
+                            eps=eps, 
+                            min_samples=min_samples)
+    elif weighted:
+        labels = gridDBSCAN(df[['x', 'y']].to_numpy(), 
+                            eps=eps, 
+                            min_samples=min_samples)
+    else:
+        #instantiate dbscan
+        db = DBSCAN(eps=eps, 
+                    min_samples=min_samples, 
+                    metric='euclidean', 
+                    n_jobs=-1
+                   )
+
+        #fit and predict to data
+        labels = db.fit_predict(df[['x', 'y']])
     
     #Returns the sorted unique elements of an array
-    labels_unique = np.unique(db.labels_)
+    labels_unique = np.unique(labels)
     #drop the -1 labels which are unlabeled
     labels_unique = labels_unique[labels_unique != -1]
     
     
-    return db.labels_, labels_unique
+    return labels, labels_unique
+
+@st.cache(allow_output_mutation=True)
+def load_ward_store():
+    """
+    Returns the wards partitioned by team and type and sorted by time, built once
+    
+    """
+    df_obs, df_sen, _, _, _ = load_data()
+    return TimeSortedWards(df_obs, df_sen)
+
+
+@st.cache(allow_output_mutation=True)
+def load_cluster_cache(maxsize=256):
+    """
+    Returns the clustering cache shared by every rerun of the app
+    
+    """
+    return ClusterCache(maxsize=maxsize)
+
+
+
+def getClusters(df, eps=3, min_samples=100, cache=None, key=None):
+    """
+    Returns labels, unique labels and centroids of a dataframe after dbscan clustering,
+    looked up in the cache first when one is given.
+    
+        Parameters
+    ----------
+    
+    df: Pandas dataframe
+        Data to be used for fitting, see getLabels
+        
+    cache: ClusterCache, default=None
+        Memo of previous results
+        
+    key: tuple, default=None
+        Identifies the data in df, e.g. (team, ward type, t1, t2).
+        eps and min_samples are added to it.
+    
+    """
+    if cache is not None and key is not None:
+        key = tuple(key) + (eps, min_samples)
+        result = cache.get(key)
+        if result is not None:
+            return result
+        
+    labels, labels_unique = getLabels(df, eps=eps, min_samples=min_samples)
+    
+    result = summarizeClusters(df, labels, labels_unique)
+    if cache is not None and key is not None:
+        cache.put(key, result)
+        
+    return result
+
+
+def summarizeClusters(df, labels, labels_unique):
+    """
+    Returns labels, unique labels and the centroid of each cluster, weighted by ward count for cells
+    
+    """
+    weights = df['count'].to_numpy() if 'count' in df.columns else np.ones(len(df))
+    centroids = np.array([np.average(df[['x', 'y']].to_numpy()[labels==label], 
+                                     axis=0, 
+                                     weights=weights[labels==label]) 
+                          for label in labels_unique]).reshape(-1, 2)
+    
+    return (labels, labels_unique, centroids)
+
+
+def seedClusterCache(cache, cube, view):
+    """
+    Puts the snapshot's clusters of the default view into the cache so the first page needs no DBSCAN
+    
+    """
+    if view is None:
+        return
+    counts = cube.window(view['t1'], view['t2'])
+    for i, team in enumerate(cube.teams):
+        for k, ward_type in enumerate(cube.ward_types):
+            key = (team, ward_type, view['t1'], view['t2'], view['eps'], view['min_samples'])
+            if key in cache:
+                continue
+            labels = np.asarray(view['labels'][(team, ward_type)])
+            labels_unique = np.unique(labels)
+            cache.put(key, summarizeClusters(cube.cells(counts[i, k]), labels, labels_unique[labels_unique != -1]))
+
+
 
 def populateSubPlot(df,
                     eps=3,
@@ -110,7 +248,10 @@ def populateSubPlot(df,
                     row=None, 
                     col=None,
                     title='Some Ward',
-                    img=Image.open('maps/map_detailed_723.jpeg')
+                    img=None,
+                    cache=None,
+                    cache_key=None,
+                    backend='auto'
                    ):
     
         """
@@ -144,24 +285,56 @@ def populateSubPlot(df,
     title: string, default=None
         Title of subplot
         
-    img: string, default=presaved image
-        Image to be filled in background
+    img: image or array, default=None
+        Image to be filled in background, the presaved map when None
         
+    cache: ClusterCache, default=None
+        Memo of clustering results
+        
+    cache_key: tuple, default=None
+        Key of df inside the cache, see getClusters
+        
+    backend: string, default='auto'
+        'scatter', 'raster', or 'auto' to draw an image above RASTER_THRESHOLD points
         
         
     
     """
         #assign labels to data and get unique labels
-        db_labels, unique_labels = getLabels(df,
-                                             eps=eps, 
-                                             min_samples=min_samples)
+        with timer.stage('cluster ' + title, rows=len(df)):
+            db_labels, unique_labels, _ = getClusters(df,
+                                                      eps=eps, 
+                                                      min_samples=min_samples,
+                                                      cache=cache,
+                                                      key=cache_key)
     
         #set the title
         axs[row,col].set_title(title)
         
         #slap image on background
+        if img is None:
+            img = Image.open('maps/map_detailed_723.jpeg')
         axs[row,col].imshow(img, extent=[0, 128, 0, 128])
 
+        if backend == 'auto':
+            backend = 'raster' if len(df) > RASTER_THRESHOLD else 'scatter'
+            
+        if backend == 'raster':
+            #one pixel per map cell colored by label, labels without a color are left out like in the scatter
+            shown = np.where(db_labels < len(colors), db_labels, -1)
+            renderPoints(axs[row,col], 
+                         df['x'].to_numpy(), 
+                         df['y'].to_numpy(), 
+                         values=shown, 
+                         mode='label', 
+                         extent=(0, 128, 0, 128), 
+                         resolution=128, 
+                         cmap=ListedColormap(colors), 
+                         vmin=-0.5, 
+                         vmax=len(colors) - 0.5, 
+                         backend='raster')
+            return
+        
         #for each label and color
         for label, color in zip(unique_labels, colors):
             #places where label matches
@@ -185,13 +358,27 @@ def makeQuadSubplots(df_rad_obs,
                      df_dir_sen, 
                      suptitle='Big title',
                      eps=3, 
-                     min_samples=50):
+                     min_samples=50,
+                     cache=None,
+                     t1=None,
+                     t2=None,
+                     store=None,
+                     img=None):
     
     
     """
-    Makes 4 subplots and fills each using data from the 4 dataframes.
+    Makes 4 subplots and fills each using data from the 4 dataframes, over the map img when given.
+    If a ClusterCache is given, results are memoized by team, ward type, t1, t2, eps and min_samples.
+    If a TimeSortedWards store is given, the dataframes are its (t1, t2] slices and are taken from it when None.
     
     """
+    #wards and cells of the same window are clustered under different keys
+    source = ()
+    if store is not None:
+        if df_rad_obs is None:
+            df_rad_obs, df_dir_obs, df_rad_sen, df_dir_sen = store.timeSeparation(t1=t1, t2=t2)
+        source = ('wards',)
+        
     fig, axs = plt.subplots(2, 2, 
                             figsize=(10,10)
                            )
@@ -204,7 +391,10 @@ def makeQuadSubplots(df_rad_obs,
                     fig=fig, 
                     axs=axs, 
                     row=0, 
-                    col=0, title='Obsever Wards Radiant')
+                    col=0, title='Obsever Wards Radiant',
+                    cache=cache,
+                    cache_key=('radiant', 'observer', t1, t2) + source,
+                    img=img)
 
 
     populateSubPlot(df=df_dir_obs, 
@@ -213,7 +403,10 @@ def makeQuadSubplots(df_rad_obs,
                     fig=fig, 
                     axs=axs, 
                     row=0, 
-                    col=1, title='Obsever Wards Dire')
+                    col=1, title='Obsever Wards Dire',
+                    cache=cache,
+                    cache_key=('dire', 'observer', t1, t2) + source,
+                    img=img)
 
 
     populateSubPlot(df=df_rad_sen, 
@@ -222,7 +415,10 @@ def makeQuadSubplots(df_rad_obs,
                     fig=fig, 
                     axs=axs, 
                     row=1, 
-                    col=0, title='Sentry Wards Radiant')
+                    col=0, title='Sentry Wards Radiant',
+                    cache=cache,
+                    cache_key=('radiant', 'sentry', t1, t2) + source,
+                    img=img)
 
     populateSubPlot(df=df_dir_sen, 
                     eps=eps, 
@@ -230,7 +426,10 @@ def makeQuadSubplots(df_rad_obs,
                     fig=fig, 
                     axs=axs, 
                     row=1, 
-                    col=1, title='Sentry Wards Dire')
+                    col=1, title='Sentry Wards Dire',
+                    cache=cache,
+                    cache_key=('dire', 'sentry', t1, t2) + source,
+                    img=img)
     
     
     return fig, axs
@@ -241,8 +440,12 @@ def timeSeparation(df_rad_obs,
                    df_rad_sen, 
                    df_dir_sen,
                   t1=0,
-                  t2=10):
+                  t2=10,
+                  store=None):
     
+    #binary search on the time sorted partitions instead of scanning the 4 dataframes
+    if store is not None:
+        return store.timeSeparation(t1=t1, t2=t2)
     
     df1 = df_rad_obs[(df_rad_obs['time']>t1) & (df_rad_obs['time']<=t2)]
     df2 = df_dir_obs[(df_dir_obs['time']>t1) & (df_dir_obs['time']<=t2)]
@@ -258,6 +461,16 @@ def timeSeparation(df_rad_obs,
 st.title('DOTA2 Ward Explorer')
 st.subheader('An Interactive Tool To Explore Vision')
 
+# PERFORMANCE PANEL #
+
+#nothing is recorded unless asked for
+show_timings = st.sidebar.checkbox('Show stage timings')
+profile_rerun = st.sidebar.checkbox('Profile this rerun')
+#one timer per run, bound to this session's thread so other sessions never touch it
+timer = useTimer(StageTimer(enabled=show_timings))
+if profile_rerun:
+    timer.startProfile()
+
 
 
 # ASK FOR USER INPUT #
@@ -279,33 +492,54 @@ min_samples = st.slider(label = 'Select Minimum Samples Per Cluster',
 
 # READ AND LOAD DATA#
 
-df_obs, df_sen, img = load_data()
-
-#separate by team
-df_rad_obs = df_obs[(df_obs['is_radiant']==1)]
-df_dir_obs = df_obs[(df_obs['is_radiant']==0)]
-
-df_rad_sen = df_sen[(df_sen['is_radiant']==1)]
-df_dir_sen = df_sen[(df_sen['is_radiant']==0)]
+with startup.stage('load_data'), timer.stage('load_data') as info:
+    df_obs, df_sen, img, cube, view = load_data()
+    info['rows'] = len(df_obs) + len(df_sen)
+with startup.stage('cluster_cache'):
+    cluster_cache = load_cluster_cache()
+    seedClusterCache(cluster_cache, cube, view)
 
 # APPLY USER INPUT #
 
-df1, df2, df3, df4 = timeSeparation(df_rad_obs, 
-                                    df_dir_obs, 
-                                    df_rad_sen, 
-                                    df_dir_sen,
-                                    t1=t1,
-                                    t2=t2)
-
-
-fig, axs = makeQuadSubplots(df1, 
-                            df2, 
-                            df3, 
-                            df4, 
-                            eps=eps_slide_value, 
-                            min_samples=50)
-
-
-st.pyplot(fig)
+#occupied cells by default, every ward when asked for
+cluster_wards = st.sidebar.checkbox('Cluster individual wards')
+with startup.stage('timeSeparation'), timer.stage('timeSeparation'):
+    if cluster_wards:
+        store = load_ward_store()
+        df1, df2, df3, df4 = timeSeparation(None, None, None, None, t1=t1, t2=t2, store=store)
+    else:
+        df1, df2, df3, df4 = cube.timeSeparation(t1=t1, t2=t2)
+
+
+with startup.stage('makeQuadSubplots'), timer.stage('makeQuadSubplots'):
+    fig, axs = makeQuadSubplots(df1, 
+                                df2, 
+                                df3, 
+                                df4, 
+                                eps=eps_slide_value, 
+                                min_samples=50,
+                                cache=cluster_cache,
+                                t1=t1,
+                                t2=t2,
+                                store=store if cluster_wards else None,
+                                img=img)
+
+
+with startup.stage('st.pyplot'), timer.stage('st.pyplot'):
+    st.pyplot(fig)
+
+#time to serve this run by phase, the first run of a fresh container is the cold start
+startup.record('total', time.perf_counter() - start_time)
+st.sidebar.write('Startup phases', startup.report()[['stage', 'seconds']])
+
+#how often a setting was already clustered
+st.sidebar.write('Cluster cache', cluster_cache.info())
+
+if show_timings:
+    st.sidebar.write('Stage timings', timer.report())
+    
+if profile_rerun:
+    path = profilePath('appWardFinder')
+    st.sidebar.text(f'Profile saved to {path}\n' + timer.stopProfile(path=path))
 
 
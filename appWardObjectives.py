@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import requests
 import io
@@ -5,6 +6,8 @@ from io import BytesIO
 from PIL import Image
 import matplotlib.pyplot as plt
 
+from HelperClasses import MatchFinder, ComboRenderer, StageTimer, useTimer, profilePath
+
 
 #this line must come first
 #st.set_page_config(layout="wide")
@@ -24,12 +27,45 @@ def load_invalid_combos():
     #store text 
     text = response.text
     
-    #separate by new line character
-    invalid_combos = text.split('\n')
+    #separate by new line character, a set for constant time lookups
+    invalid_combos = set(text.split('\n'))
     
     return invalid_combos
 
 
+def folder_signature(folder='data_obj'):
+    """
+    Names, sizes and modification times of the data files, changes whenever a file is added, removed or rewritten
+    
+    """
+    if not os.path.isdir(folder):
+        return None
+    
+    signature = []
+    for name in sorted(os.listdir(folder)):
+        if not name.startswith('.'):
+            stat = os.stat(os.path.join(folder, name))
+            signature.append((name, stat.st_size, stat.st_mtime_ns))
+    
+    return tuple(signature)
+
+
+@st.cache(allow_output_mutation=True)
+def load_renderer(folder='data_obj', signature=None):
+    """
+    Builds a local combo renderer from the ward data, returns None when no data folder is available.
+    The signature is only part of the cache key, so the renderer is rebuilt once the folder changes
+    
+    """
+    if signature is None:
+        return None
+    
+    #only new or changed files are parsed
+    _, df_obs, df_sen = MatchFinder(folder=folder).getData(cache_dir='.ward_cache', compact=True)
+    
+    return ComboRenderer(df_obs, df_sen)
+
+
 @st.cache(persist=True)
 def load_tower_image(combo):
     """
@@ -70,8 +106,24 @@ st.subheader('An Interactive Tool To Explore Warding')
 st.write('Select the most recently captured objective for each lane. A value of zero means that the tower is still alive.')
 st.write('Scroll down to explore warding related to Roshan.')
 
+# PERFORMANCE PANEL #
+
+#nothing is recorded unless asked for
+show_timings = st.sidebar.checkbox('Show stage timings')
+profile_rerun = st.sidebar.checkbox('Profile this rerun')
+#one timer per run, bound to this session's thread so other sessions never touch it
+timer = useTimer(StageTimer(enabled=show_timings))
+if profile_rerun:
+    timer.startProfile()
+
+#render locally when the ward data is available, otherwise use the prebuilt maps
+with timer.stage('load_renderer'):
+    renderer = load_renderer('data_obj', folder_signature('data_obj'))
+
 #load invalid cases
-invalid_combos = load_invalid_combos()
+if renderer is None:
+    with timer.stage('load_invalid_combos'):
+        invalid_combos = load_invalid_combos()
 
 
 # ASK FOR USER INPUT #
@@ -123,12 +175,22 @@ combo_string_tuple = tuple((str(x) for x in user_input_tuple))
 combo = '_'.join([a+b for a,b in zip('ABCDEF', combo_string_tuple)])
 
 if st.button('Show Wards for Towers'):
-    if combo in invalid_combos:
+    if renderer is not None:
+        if not renderer.isValid(combo):
+            st.write("Not enough data and/or invalid combo! Try again.")
+        else:
+            with timer.stage('render_combo'):
+                combo_path = renderer.render(combo)
+            with timer.stage('st.image'):
+                st.image(combo_path)
+    elif combo in invalid_combos:
         st.write("Not enough data and/or invalid combo! Try again.")
     else:
         #st.write(combo)
-        combo_img = load_tower_image(combo)
-        st.image(combo_img)
+        with timer.stage('load_tower_image'):
+            combo_img = load_tower_image(combo)
+        with timer.stage('st.image'):
+            st.image(combo_img)
 
         
 rosh_attempt = st.slider(label = 'Roshan Attempt Number', 
@@ -141,8 +203,18 @@ rosh_attempt = st.slider(label = 'Roshan Attempt Number',
 
         
 if st.button('Show Wards for Roshan'):
-    rosh_img = load_rosh_image(rosh_attempt)
-    st.image(rosh_img)
+    with timer.stage('load_rosh_image'):
+        rosh_img = load_rosh_image(rosh_attempt)
+    with timer.stage('st.image'):
+        st.image(rosh_img)
+    
+    
+if show_timings:
+    st.sidebar.write('Stage timings', timer.report())
+    
+if profile_rerun:
+    path = profilePath('appWardObjectives')
+    st.sidebar.text(f'Profile saved to {path}\n' + timer.stopProfile(path=path))
 
                  
 
@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+
+"""
+End to end benchmark of ingest, merge, clustering and rendering on synthetic data from generateData.py.
+Each run appends one line per stage to a JSON lines file tagged with the current git commit,
+so that runs of two commits can be compared.
+
+Usage:
+    python benchmark.py --matches 10000
+    python benchmark.py --compare <commit_a> <commit_b>
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+import matplotlib
+#no display needed, must come before pyplot is imported
+matplotlib.use('Agg')
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from HelperClasses import WardFinder, ObjectiveFinder, gridDBSCAN, saveWardMap
+from generateData import writeDataset
+
+
+def gitCommit():
+    """
+    Returns the short hash of HEAD, with a + when the tree has local changes.
+    Runs in the folder of this file, so the result does not depend on the working directory.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], 
+                                capture_output=True, text=True, check=True, cwd=repo).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], 
+                               capture_output=True, text=True, check=True, cwd=repo).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    
+    
+def measure(fn):
+    """
+    Runs fn twice, once for wall time and once under tracemalloc for peak memory.
+    Returns the result of the first run, the seconds and the peak in MB.
+    """
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return result, seconds, peak / 2**20
+
+
+def runBenchmark(matches=1_000, seed=0, data_root='bench_data', map_img='maps/map_detailed_723.jpeg'):
+    """
+    Runs every stage and returns a list of result dicts.
+    
+    Parameters
+    ----------
+    matches: int, default=1_000
+        Number of synthetic matches
+        
+    seed: int, default=0
+        Seed of the synthetic data
+        
+    data_root: string, default='bench_data'
+        Where synthetic datasets are kept between runs
+    """
+    folder = os.path.join(data_root, f'matches_{matches}_seed_{seed}')
+    if not os.path.isdir(folder):
+        writeDataset(folder, matches, seed=seed)
+        
+    stages = []
+    
+    def record(stage, fn, rows=None):
+        result, seconds, peak_mb = measure(fn)
+        stages.append({'stage': stage, 
+                       'seconds': seconds, 
+                       'peak_mb': peak_mb, 
+                       'rows': rows(result) if rows else None})
+        print(f'{stage:>18}: {seconds:8.3f}s {peak_mb:9.1f} MB')
+        return result
+    
+    df_obs, df_sen = record('getWardData', 
+                            lambda: WardFinder(folder).getWardData(), 
+                            rows=lambda r: len(r[0]) + len(r[1]))
+    df_obj = record('getObjectiveData', 
+                    lambda: ObjectiveFinder(folder).getObjectiveData(), 
+                    rows=len)
+    record('objective_merge', 
+           lambda: df_obs.merge(right=df_obj, how='left', on='match_id'), 
+           rows=len)
+    
+    #same input and parameters as appWardFinder.getLabels on radiant observers
+    xy = df_obs.loc[df_obs['is_radiant'] == 1, ['x', 'y']].to_numpy() - 64
+    record('cluster_grid', 
+           lambda: gridDBSCAN(xy, eps=2, min_samples=50), 
+           rows=len)
+    if len(xy) <= 500_000:
+        record('cluster_rows', 
+               lambda: DBSCAN(eps=2, min_samples=50, n_jobs=-1).fit_predict(xy), 
+               rows=len)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        record('render_map', 
+               lambda: saveWardMap(os.path.join(tmp, 'map.png'), df_obs, df_sen, map_img=map_img), 
+               rows=lambda r: len(df_obs) + len(df_sen))
+    
+    meta = {'commit': gitCommit(), 
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 
+            'matches': matches, 
+            'seed': seed}
+    return [dict(meta, **stage) for stage in stages]
+
+
+def compare(results_path, commit_a, commit_b):
+    """
+    Prints the stage timings of two commits side by side, using the latest run of each
+    for every number of matches both have.
+    """
+    latest = {}
+    with open(results_path) as f:
+        for line in f:
+            r = json.loads(line)
+            latest[(r['commit'], r['matches'], r['stage'])] = r
+            
+    print(f"{'matches':>8} {'stage':>18} {commit_a:>10} {commit_b:>10} {'ratio':>7} {'peak_mb':>17}")
+    for (commit, matches, stage), a in sorted(latest.items(), key=lambda kv: (kv[0][1], kv[0][2])):
+        if commit != commit_a or (commit_b, matches, stage) not in latest:
+            continue
+        b = latest[(commit_b, matches, stage)]
+        ratio = b['seconds'] / a['seconds'] if a['seconds'] else np.nan
+        print(f"{matches:>8} {stage:>18} {a['seconds']:>9.3f}s {b['seconds']:>9.3f}s {ratio:>7.2f} "
+              f"{a['peak_mb']:>8.1f}/{b['peak_mb']:<8.1f}")
+        
+        
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ward pipeline on synthetic data.')
+    parser.add_argument('--matches', type=int, nargs='+', default=[1_000], help='dataset sizes to run')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--data-root', default='bench_data', help='folder of the synthetic datasets')
+    parser.add_argument('--results', default='benchmark_results.jsonl', help='JSON lines file of results')
+    parser.add_argument('--map-img', default='maps/map_detailed_723.jpeg', help='background map')
+    parser.add_argument('--compare', nargs=2, metavar=('COMMIT_A', 'COMMIT_B'), help='compare two commits')
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare(args.results, *args.compare)
+    else:
+        for matches in args.matches:
+            print(f'--- {matches} matches ---')
+            results = runBenchmark(matches=matches, seed=args.seed, data_root=args.data_root, map_img=args.map_img)
+            with open(args.results, 'a') as f:
+                for r in results:
+                    f.write(json.dumps(r) + '\n')
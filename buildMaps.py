@@ -0,0 +1,233 @@
+#! /usr/bin/env python
+
+"""
+Builds every tower combo map, the Roshan attempt maps and invalid_cases.txt from the JSON data folder.
+Only maps whose input wards changed since the last build are rendered again.
+
+Usage:
+    python buildMaps.py --folder data_obj --out maps --n-jobs -1
+"""
+
+import os
+import json
+import time
+import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+#no display needed, must come before pyplot is imported
+matplotlib.use('Agg')
+
+import numpy as np
+import pandas as pd
+
+from HelperClasses import (MatchFinder, ComboIndex, SpatialIndex, LANES, comboName, 
+                           roshanWards, saveWardMap)
+
+
+def subsetHash(row_hashes):
+    """
+    Order independent hash of a set of rows from their pandas row hashes.
+    """
+    return format(int(np.sum(row_hashes, dtype=np.uint64)), '016x') + format(len(row_hashes), 'x')
+
+
+def renderTask(task):
+    """
+    Renders one map inside a worker process and returns the time it took.
+    """
+    start = time.perf_counter()
+    path, df_obs, df_sen, title, params = task
+    saveWardMap(path, df_obs, df_sen, title=title, **params)
+    return time.perf_counter() - start
+
+
+def buildMaps(folder='data_obj', 
+              out='maps', 
+              invalid_path='invalid_cases.txt',
+              cache_dir='.ward_cache', 
+              n_jobs=-1, 
+              min_wards=100, 
+              rosh_attempts=3, 
+              eps=3,
+              min_fraction=0.01,
+              map_img='maps/map_detailed_723.jpeg',
+              force=False):
+    """
+    Runs the whole pipeline and returns the manifest that is written next to the maps.
+    
+    Parameters
+    ----------
+    folder: string, default='data_obj'
+        The folder containing the JSON data files
+        
+    out: string, default='maps'
+        Folder receiving the PNG maps and manifest.json
+        
+    invalid_path: string, default='invalid_cases.txt'
+        Where the list of invalid combos is written
+        
+    cache_dir: string, default='.ward_cache'
+        Ingest cache, see ShardCache
+        
+    n_jobs: int, default=-1
+        Number of processes used for ingest and rendering. -1 means using all processors.
+        
+    min_wards: int, default=100
+        Combos with fewer observer or sentry wards than this are invalid
+        
+    rosh_attempts: int, default=3
+        Number of Roshan attempt maps
+        
+    eps, min_fraction: float
+        Clustering parameters, see clusterCentroids
+        
+    map_img: string, default='maps/map_detailed_723.jpeg'
+        Background map
+        
+    force: bool, default=False
+        Render every map even if its input did not change
+    """
+    timings = {}
+    
+    #INGEST#
+    start = time.perf_counter()
+    df_obj, df_obs, df_sen = MatchFinder(folder=folder).getData(n_jobs=n_jobs, 
+                                                                cache_dir=cache_dir, 
+                                                                compact=True)
+    timings['ingest'] = time.perf_counter() - start
+    
+    #PARTITION ONCE BY COMBO#
+    start = time.perf_counter()
+    cols = ['x', 'y', 'time', 'is_radiant']
+    indexes = {}
+    hashes = {}
+    for name, df in (('obs', df_obs), ('sen', df_sen)):
+        indexes[name] = ComboIndex(df)
+        #row hashes sorted like the index so each combo is one contiguous slice
+        hashes[name] = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()[indexes[name].order]
+    timings['partition'] = time.perf_counter() - start
+    
+    manifest_path = os.path.join(out, 'manifest.json')
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f).get('maps', {})
+    old = {} if force else previous
+            
+    params = {'map_img': map_img, 'eps': eps, 'min_fraction': min_fraction}
+    #a change of parameters invalidates every map
+    version = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:12]
+    
+    maps = {}
+    invalid = []
+    tasks = []
+    
+    for code in range(4 ** len(LANES)):
+        name = comboName(code)
+        counts = {k: int(idx.bounds[code + 1] - idx.bounds[code]) for k, idx in indexes.items()}
+        if min(counts.values()) < min_wards:
+            invalid.append(name)
+            continue
+            
+        key = version + ''.join(subsetHash(hashes[k][indexes[k].bounds[code]:indexes[k].bounds[code + 1]]) 
+                                for k in ('obs', 'sen'))
+        path = os.path.join(out, name + '.png')
+        maps[name] = {'key': key, 'obs': counts['obs'], 'sen': counts['sen']}
+        
+        #unchanged input, keep the previous render
+        if name in old and old[name]['key'] == key and os.path.exists(path):
+            maps[name]['seconds'] = old[name].get('seconds')
+            continue
+        tasks.append((path, indexes['obs'].get(code), indexes['sen'].get(code), name, params))
+        
+    #every attempt only reads the Roshan quadrant of the index
+    rosh_indexes = {}
+    if rosh_attempts > 0:
+        start = time.perf_counter()
+        rosh_indexes = {'obs': SpatialIndex(df_obs), 'sen': SpatialIndex(df_sen)}
+        timings['spatial_index'] = time.perf_counter() - start
+        
+    for attempt in range(1, rosh_attempts + 1):
+        name = f'rosh_attempt_{attempt:02d}'
+        rosh_obs = roshanWards(df_obs, df_obj, attempt, index=rosh_indexes['obs'])
+        rosh_sen = roshanWards(df_sen, df_obj, attempt, index=rosh_indexes['sen'])
+        key = version + subsetHash(pd.util.hash_pandas_object(rosh_obs[cols], index=False).to_numpy()) \
+                      + subsetHash(pd.util.hash_pandas_object(rosh_sen[cols], index=False).to_numpy())
+        path = os.path.join(out, name + '.png')
+        maps[name] = {'key': key, 'obs': len(rosh_obs), 'sen': len(rosh_sen)}
+        
+        if name in old and old[name]['key'] == key and os.path.exists(path):
+            maps[name]['seconds'] = old[name].get('seconds')
+            continue
+        tasks.append((path, rosh_obs, rosh_sen, f'Roshan Attempt #{attempt}', params))
+        
+    #maps of combos that became invalid would otherwise still be served
+    removed = sorted(set(previous) - set(maps))
+    for name in removed:
+        path = os.path.join(out, name + '.png')
+        if os.path.exists(path):
+            os.remove(path)
+        
+    #RENDER#
+    start = time.perf_counter()
+    os.makedirs(out, exist_ok=True)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1 or len(tasks) < 2:
+        seconds = [renderTask(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            seconds = list(executor.map(renderTask, tasks, chunksize=4))
+    for task, sec in zip(tasks, seconds):
+        maps[os.path.splitext(os.path.basename(task[0]))[0]]['seconds'] = sec
+    timings['render'] = time.perf_counter() - start
+    
+    with open(invalid_path, 'w') as f:
+        f.write('\n'.join(invalid))
+        
+    manifest = {'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'rendered': [os.path.splitext(os.path.basename(task[0]))[0] for task in tasks],
+                'skipped': len(maps) - len(tasks),
+                'removed': removed,
+                'invalid': invalid,
+                'timings': timings,
+                'maps': maps}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+        
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build tower combo and Roshan ward maps.')
+    parser.add_argument('--folder', default='data_obj', help='folder of JSON data files')
+    parser.add_argument('--out', default='maps', help='output folder for the maps')
+    parser.add_argument('--invalid-path', default='invalid_cases.txt', help='where to list invalid combos')
+    parser.add_argument('--cache-dir', default='.ward_cache', help='ingest cache folder')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='number of processes, -1 for all')
+    parser.add_argument('--min-wards', type=int, default=100, help='minimum wards per type for a valid combo')
+    parser.add_argument('--rosh-attempts', type=int, default=3, help='number of Roshan attempt maps')
+    parser.add_argument('--eps', type=float, default=3, help='DBSCAN radius in map cells')
+    parser.add_argument('--min-fraction', type=float, default=0.01, help='DBSCAN min_samples as a fraction of the wards')
+    parser.add_argument('--map-img', default='maps/map_detailed_723.jpeg', help='background map')
+    parser.add_argument('--force', action='store_true', help='render every map again')
+    args = parser.parse_args()
+    
+    manifest = buildMaps(folder=args.folder, 
+                         out=args.out, 
+                         invalid_path=args.invalid_path,
+                         cache_dir=args.cache_dir, 
+                         n_jobs=args.n_jobs, 
+                         min_wards=args.min_wards, 
+                         rosh_attempts=args.rosh_attempts, 
+                         eps=args.eps,
+                         min_fraction=args.min_fraction,
+                         map_img=args.map_img,
+                         force=args.force)
+    
+    print(f"Rendered {len(manifest['rendered'])} maps, skipped {manifest['skipped']}, "
+          f"removed {len(manifest['removed'])}, {len(manifest['invalid'])} invalid combos.")
+    for stage, sec in manifest['timings'].items():
+        print(f'{stage}: {sec:.2f}s')
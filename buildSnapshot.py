@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+
+"""
+Prebuilds what appWardFinder needs on startup: the translated ward columns, the ward count cube,
+the decoded background map and the clusters of the default view. The app memory maps the result
+instead of downloading CSVs and the map, and shows its first page without running DBSCAN.
+
+Usage:
+    python buildSnapshot.py --obs df_obs.csv --sen df_sentry.csv --out snapshot
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from HelperClasses import compactWards, translateWards, cellDBSCAN, WardCube, saveSnapshot
+
+
+S3_BUCKET = 'https://nadim-kawwa-dota-bucket.s3.us-west-2.amazonaws.com'
+#columns the app keeps for each ward table
+COLUMNS = ['match_id', 'x', 'y', 'time', 'is_radiant']
+#sliders of appWardFinder when the page opens
+DEFAULT_VIEW = {'eps': 2.0, 'min_samples': 50, 't1': 10, 't2': 20}
+
+
+def buildSnapshot(obs=S3_BUCKET + '/df_obs.csv',
+                  sen=S3_BUCKET + '/df_sentry.csv',
+                  map_img='maps/map_detailed_723.jpeg',
+                  out='snapshot',
+                  view=DEFAULT_VIEW):
+    """
+    Writes the snapshot and returns its meta.
+    
+    Parameters
+    ----------
+    obs: string
+        Path or URL of the observer CSV
+        
+    sen: string
+        Path or URL of the sentry CSV
+        
+    map_img: string, default='maps/map_detailed_723.jpeg'
+        Background map
+        
+    out: string, default='snapshot'
+        Output folder
+        
+    view: dict, default=DEFAULT_VIEW
+        eps, min_samples, t1 and t2 of the view whose clusters are precomputed
+    """
+    df_obs = translateWards(compactWards(pd.read_csv(obs)))
+    df_sen = translateWards(compactWards(pd.read_csv(sen)))
+    cube = WardCube(df_obs, df_sen)
+    
+    arrays = {'map': np.asarray(Image.open(map_img).convert('RGB')), 
+              'cube': cube.prefix}
+    for name, df in (('obs', df_obs), ('sen', df_sen)):
+        for column in COLUMNS:
+            arrays[f'{name}_{column}'] = df[column].to_numpy()
+    
+    #same cells and order as cube.timeSeparation so the labels line up in the app
+    counts = cube.window(view['t1'], view['t2'])
+    for i, team in enumerate(cube.teams):
+        for k, ward_type in enumerate(cube.ward_types):
+            cells = cube.cells(counts[i, k])
+            arrays[f'labels_{team}_{ward_type}'] = cellDBSCAN(cells[['x', 'y']].to_numpy(), 
+                                                              cells['count'].to_numpy(), 
+                                                              eps=view['eps'], 
+                                                              min_samples=view['min_samples'])
+    
+    meta = {'first_minute': cube.first_minute, 
+            'columns': COLUMNS, 
+            'view': view, 
+            'sources': {'obs': obs, 'sen': sen, 'map': map_img}}
+    saveSnapshot(out, arrays, meta)
+    return meta
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prebuild the startup snapshot of appWardFinder.')
+    parser.add_argument('--obs', default=S3_BUCKET + '/df_obs.csv', help='observer CSV path or URL')
+    parser.add_argument('--sen', default=S3_BUCKET + '/df_sentry.csv', help='sentry CSV path or URL')
+    parser.add_argument('--map-img', default='maps/map_detailed_723.jpeg', help='background map')
+    parser.add_argument('--out', default='snapshot', help='output folder')
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    buildSnapshot(obs=args.obs, sen=args.sen, map_img=args.map_img, out=args.out)
+    print(f'Wrote snapshot to {args.out} in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,374 @@
+#! /usr/bin/env python
+
+"""
+Pulls the rows of ward_logs_pro_matches.sql from the OpenDota explorer into JSON files in the
+data_obj format. The query is split into start_time slices that are paged concurrently by
+(start_time, match_id) keyset, and a checkpoint file lets a failed pull resume where it stopped.
+
+Usage:
+    python fetchData.py --sql ward_logs_pro_matches.sql --folder data_obj --concurrency 4
+
+Offline, against a local stand-in filled with synthetic matches:
+    python fetchData.py --local 2000 --folder data_local
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode, urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+OPENDOTA_URL = 'https://api.opendota.com/api/explorer'
+#columns holding JSON arrays, stored as text by the local stand-in
+JSON_COLUMNS = ('sen_log', 'obs_log', 'objectives')
+
+
+def baseQuery(sql):
+    """
+    Strips the trailing ORDER BY and LIMIT of a query so it can be wrapped into keyset pages.
+    """
+    sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.S)
+    sql = re.sub(r'\s+ORDER\s+BY\s+[^;]*?(\s+LIMIT\s+\d+)?\s*;?\s*$', '', sql, flags=re.I | re.S)
+    return sql.strip()
+
+
+def pageQuery(base, cursor, hi, page_size):
+    """
+    Query of the page after cursor=(start_time, match_id) with start_time below hi.
+    Plain SQL so that it runs on Postgres as well as on the local sqlite stand-in.
+    """
+    start_time, match_id = cursor
+    return (f'SELECT * FROM ({base}) q '
+            f'WHERE (q.start_time > {int(start_time)} '
+            f'OR (q.start_time = {int(start_time)} AND q.match_id > {int(match_id)})) '
+            f'AND q.start_time < {int(hi)} '
+            f'ORDER BY q.start_time, q.match_id '
+            f'LIMIT {int(page_size)}')
+
+
+def rangeQuery(base):
+    """
+    Query of the smallest and largest start_time.
+    """
+    return f'SELECT min(q.start_time) AS lo, max(q.start_time) AS hi FROM ({base}) q'
+
+
+class ExplorerConnection:
+    def __init__(self, url=OPENDOTA_URL, retries: int = 4, backoff: float = 2.0, timeout: float = 120):
+        """
+        One persistent HTTP connection to the explorer endpoint, reused for every page of a slice.
+
+        Parameters
+        ----------
+        url: string, default=OPENDOTA_URL
+            Explorer endpoint, takes the query in its 'sql' parameter
+
+        retries: int, default=4
+            Attempts per query before giving up
+
+        backoff: float, default=2.0
+            Seconds to wait after the first failure, doubled after each one
+        """
+        self.url = urlparse(url)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.conn = None
+
+
+    def _connect(self):
+        connection = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = connection(self.url.netloc, timeout=self.timeout)
+
+
+    def query(self, sql):
+        """
+        Runs a query and returns its rows as a list of dictionaries.
+        """
+        for attempt in range(self.retries):
+            try:
+                if self.conn is None:
+                    self._connect()
+                self.conn.request('GET', self.url.path + '?' + urlencode({'sql': sql}))
+                response = self.conn.getresponse()
+                body = response.read()
+                if response.status != 200:
+                    raise IOError(f'explorer returned {response.status}: {body[:200]!r}')
+                result = json.loads(body)
+                if result.get('err'):
+                    raise IOError(f'explorer error: {result["err"]}')
+                return result['rows']
+            except (IOError, http.client.HTTPException):
+                #drop the connection, it may be half closed
+                self.close()
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def writeShard(path, rows):
+    """
+    Writes rows as one JSON array, first to a temporary file so a crash never leaves half a shard.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('[')
+        for j, row in enumerate(rows):
+            if j:
+                f.write(',\n')
+            f.write(json.dumps(row))
+        f.write(']')
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    def __init__(self, path, query_hash):
+        """
+        Progress of every slice saved as JSON after each shard. A checkpoint of another
+        query is ignored so changing the SQL starts a fresh pull.
+        """
+        self.path = path
+        self.query_hash = query_hash
+        self.slices = None
+        #reentrant so a slice can update its state and save while holding it
+        self.lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('query_hash') == query_hash:
+                self.slices = state['slices']
+
+
+    def save(self):
+        with self.lock:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'query_hash': self.query_hash, 'slices': self.slices}, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+def splitRange(lo, hi, n_slices):
+    """
+    Splits start times [lo, hi] into n_slices contiguous slices, each with an open keyset cursor.
+    """
+    edges = [lo + (hi + 1 - lo) * i // n_slices for i in range(n_slices + 1)]
+    return [{'lo': a, 'hi': b, 'cursor': [a - 1, -1], 'pages': 0, 'rows': 0, 'done': False}
+            for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def pullSlice(conn, base, state, checkpoint, folder, prefix, page_size, index):
+    """
+    Pages through one slice until it is exhausted, writing one shard per page.
+    A full page may end in the middle of a match, so the rows of its last match are
+    left for the next page and the cursor only moves past complete matches.
+    """
+    while not state['done']:
+        rows = conn.query(pageQuery(base, state['cursor'], state['hi'], page_size))
+        done = len(rows) < page_size
+        if not done:
+            last = rows[-1]['match_id']
+            keep = [row for row in rows if row['match_id'] != last]
+            if not keep:
+                raise ValueError(f'page_size={page_size} is smaller than the rows of match {last}.')
+            rows = keep
+
+        if rows:
+            path = os.path.join(folder, f'{prefix}_{index:03d}_{state["pages"]:05d}.json')
+            writeShard(path, rows)
+        #cursor, page count and the save move together so no other slice saves half an update
+        with checkpoint.lock:
+            if rows:
+                state['cursor'] = [rows[-1]['start_time'], rows[-1]['match_id']]
+                state['pages'] += 1
+                state['rows'] += len(rows)
+            state['done'] = done
+            checkpoint.save()
+
+
+async def pullAll(sql,
+                  folder='data_obj',
+                  url=OPENDOTA_URL,
+                  page_size=5_000,
+                  n_slices=8,
+                  concurrency=4,
+                  prefix='opendota',
+                  checkpoint_path=None):
+    """
+    Pulls every row of a query into JSON shards and returns the slice states.
+
+    Parameters
+    ----------
+    sql: string
+        Query text, a trailing ORDER BY and LIMIT are dropped
+
+    folder: string, default='data_obj'
+        Output folder
+
+    url: string, default=OPENDOTA_URL
+        Explorer endpoint
+
+    page_size: int, default=5_000
+        Rows per page and shard, must be larger than the rows of one match
+
+    n_slices: int, default=8
+        Number of start_time slices paged independently
+
+    concurrency: int, default=4
+        Number of slices fetched at the same time, each over its own connection
+
+    checkpoint_path: string, default=None
+        Progress file, next to the output folder by default since the readers expect only data files in it
+    """
+    os.makedirs(folder, exist_ok=True)
+    base = baseQuery(sql)
+    query_hash = hashlib.sha1(f'{base}|{page_size}|{n_slices}'.encode()).hexdigest()
+    if checkpoint_path is None:
+        checkpoint_path = os.path.normpath(folder) + '_checkpoint.json'
+    checkpoint = Checkpoint(checkpoint_path, query_hash)
+    loop = asyncio.get_running_loop()
+
+    if checkpoint.slices is None:
+        conn = ExplorerConnection(url)
+        bounds = await loop.run_in_executor(None, conn.query, rangeQuery(base))
+        conn.close()
+        lo, hi = bounds[0]['lo'], bounds[0]['hi']
+        checkpoint.slices = [] if lo is None else splitRange(int(lo), int(hi), n_slices)
+        checkpoint.save()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(index, state):
+        async with semaphore:
+            conn = ExplorerConnection(url)
+            try:
+                await loop.run_in_executor(None, pullSlice, conn, base, state, checkpoint,
+                                           folder, prefix, page_size, index)
+            finally:
+                conn.close()
+
+    await asyncio.gather(*(worker(i, s) for i, s in enumerate(checkpoint.slices) if not s['done']))
+    return checkpoint.slices
+
+
+####################################################
+####################################################
+
+
+class LocalExplorer:
+    def __init__(self, records, host='127.0.0.1', port=0):
+        """
+        Offline stand-in for the OpenDota explorer. Records are loaded into an in-memory sqlite
+        table 'player_matches' and an HTTP server answers '/api/explorer?sql=...' like the real one.
+        Use as a context manager, the endpoint is in the url attribute.
+
+        Parameters
+        ----------
+        records: iterable
+            Player match dictionaries, e.g. from generateData.generateMatches
+        """
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        #the HTTP handler threads share one sqlite connection, queries go through it one at a time
+        self.lock = threading.Lock()
+
+        records = iter(records)
+        first = next(records)
+        columns = list(first)
+        self.db.execute(f'CREATE TABLE player_matches ({", ".join(columns)})')
+        insert = f'INSERT INTO player_matches VALUES ({", ".join("?" * len(columns))})'
+        encode = lambda r: [json.dumps(r[c]) if c in JSON_COLUMNS else r[c] for c in columns]
+        self.db.execute(insert, encode(first))
+        self.db.executemany(insert, (encode(r) for r in records))
+
+        explorer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                sql = parse_qs(urlparse(self.path).query).get('sql', [''])[0]
+                try:
+                    rows = explorer.query(sql)
+                    body = json.dumps({'rows': rows, 'rowCount': len(rows), 'err': None})
+                except sqlite3.Error as e:
+                    body = json.dumps({'rows': [], 'rowCount': 0, 'err': str(e)})
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self.server.server_port}/api/explorer'
+
+
+    def query(self, sql):
+        with self.lock:
+            rows = self.db.execute(sql).fetchall()
+        return [{k: json.loads(row[k]) if k in JSON_COLUMNS else row[k] for k in row.keys()} for row in rows]
+
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pull OpenDota explorer rows into JSON data files.')
+    parser.add_argument('--sql', default='ward_logs_pro_matches.sql', help='file with the query')
+    parser.add_argument('--folder', default='data_obj', help='output folder')
+    parser.add_argument('--url', default=OPENDOTA_URL, help='explorer endpoint')
+    parser.add_argument('--page-size', type=int, default=5_000, help='rows per page')
+    parser.add_argument('--slices', type=int, default=8, help='number of start_time slices')
+    parser.add_argument('--concurrency', type=int, default=4, help='slices fetched at the same time')
+    parser.add_argument('--local', type=int, default=0,
+                        help='serve this many synthetic matches from a local stand-in instead of OpenDota')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.local:
+        from generateData import generateMatches
+        with LocalExplorer(generateMatches(args.local)) as explorer:
+            slices = asyncio.run(pullAll('SELECT * FROM player_matches',
+                                         folder=args.folder,
+                                         url=explorer.url,
+                                         page_size=args.page_size,
+                                         n_slices=args.slices,
+                                         concurrency=args.concurrency,
+                                         prefix='local'))
+    else:
+        with open(args.sql) as f:
+            sql = f.read()
+        slices = asyncio.run(pullAll(sql,
+                                     folder=args.folder,
+                                     url=args.url,
+                                     page_size=args.page_size,
+                                     n_slices=args.slices,
+                                     concurrency=args.concurrency))
+
+    print(f'Pulled {sum(s["rows"] for s in slices)} rows in {sum(s["pages"] for s in slices)} files '
+          f'to {args.folder} in {time.perf_counter() - start:.1f}s')
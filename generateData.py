@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+
+"""
+Writes seeded synthetic OpenDota data in the same shape as the output of ward_logs_pro_matches.sql,
+one JSON array per file with one record per player and match.
+
+Usage:
+    python generateData.py --matches 10000 --folder data_synthetic --seed 0
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+
+#hero ids in use
+N_HEROES = 123
+
+#popular warding spots in raw map coordinates (64 to 191), wards scatter around them
+HOTSPOTS = np.array([[96, 160], [112, 148], [128, 128], [144, 112], [160, 96],
+                     [84, 120], [120, 84], [172, 136], [136, 172], [100, 100],
+                     [156, 156], [76, 172], [172, 76], [118, 164], [140, 92]])
+
+
+def buildingKills(rng, duration):
+    """
+    Returns building_kill events for a match, towers of a lane always fall in tier order.
+    """
+    events = []
+    for team in ('goodguys', 'badguys'):
+        for lane in ('top', 'mid', 'bot'):
+            #how deep the lane was pushed
+            depth = rng.choice(4, p=[0.15, 0.35, 0.3, 0.2])
+            t = rng.integers(300, 900)
+            for tier in range(1, depth + 1):
+                if t >= duration:
+                    break
+                events.append({'time': int(t), 
+                               'type': 'building_kill', 
+                               'key': f'npc_dota_{team}_tower{tier}_{lane}'})
+                if tier == 3:
+                    events.append({'time': int(t + rng.integers(5, 60)), 
+                                   'type': 'building_kill', 
+                                   'key': f'npc_dota_{team}_melee_rax_{lane}'})
+                t += rng.integers(240, 900)
+    return events
+
+
+def roshanKills(rng, duration):
+    """
+    Returns CHAT_MESSAGE_ROSHAN_KILL events, Roshan respawns 8 to 11 minutes after a kill.
+    """
+    events = []
+    t = rng.integers(900, 1500)
+    while t < duration and rng.random() < 0.8:
+        events.append({'time': int(t), 
+                       'type': 'CHAT_MESSAGE_ROSHAN_KILL', 
+                       'team': int(rng.choice([2, 3]))})
+        t += rng.integers(480, 900)
+    return events
+
+
+def wardLog(rng, n, duration, player_slot, log_type):
+    """
+    Returns n ward placements of one player clustered around the hotspots.
+    """
+    spots = HOTSPOTS[rng.integers(0, len(HOTSPOTS), n)]
+    xy = np.clip(np.rint(spots + rng.normal(0, 3, (n, 2))), 64, 191).astype(int)
+    times = np.sort(rng.integers(-90, duration, n))
+    z = rng.integers(128, 136, n)
+    ehandle = rng.integers(1, 2**24, n)
+    slot = player_slot % 128 + 5 * (player_slot >= 128)
+    return [{'time': t, 
+             'type': log_type, 
+             'key': f'[{x}, {y}]', 
+             'slot': slot,
+             'x': x, 
+             'y': y, 
+             'z': h, 
+             'entityleft': False, 
+             'ehandle': e, 
+             'player_slot': player_slot} 
+            for t, x, y, h, e in zip(times.tolist(), xy[:, 0].tolist(), xy[:, 1].tolist(), z.tolist(), ehandle.tolist())]
+
+
+def generateMatches(n_matches, seed=0, first_match_id=5_800_000_000, first_start_time=1_609_459_200):
+    """
+    Generator of player match records, 10 per match, sorted by start_time like the SQL query.
+    
+    Parameters
+    ----------
+    n_matches: int
+        Number of matches
+        
+    seed: int, default=0
+        Seed of the random generator, same seed gives the same data
+    """
+    rng = np.random.default_rng(seed)
+    start_time = first_start_time
+    match_id = first_match_id
+    
+    for m in range(n_matches):
+        match_id += int(rng.integers(1, 50))
+        start_time += int(rng.integers(30, 900))
+        duration = int(np.clip(rng.normal(2400, 500), 900, 5400))
+        
+        objectives = buildingKills(rng, duration) + roshanKills(rng, duration)
+        objectives.append({'time': int(rng.integers(0, 300)), 'type': 'CHAT_MESSAGE_FIRSTBLOOD'})
+        objectives.sort(key=lambda e: e['time'])
+        
+        heroes = rng.choice(np.arange(1, N_HEROES + 1), 10, replace=False)
+        for p, player_slot in enumerate([0, 1, 2, 3, 4, 128, 129, 130, 131, 132]):
+            #supports place most wards
+            support = p % 5 >= 3
+            sen_log = wardLog(rng, int(rng.integers(4, 20) if support else rng.integers(1, 4)), 
+                              duration, player_slot, 'sen_log')
+            obs_log = wardLog(rng, int(rng.integers(4, 15) if support else rng.integers(1, 3)), 
+                              duration, player_slot, 'obs_log')
+            yield {'num_sen_placed': len(sen_log),
+                   'num_obs_placed': len(obs_log),
+                   'sen_log': sen_log,
+                   'obs_log': obs_log,
+                   'match_id': match_id,
+                   'start_time': start_time,
+                   'hero_id': int(heroes[p]),
+                   'account_id': int(rng.integers(1_000, 400_000_000)),
+                   'objectives': objectives}
+            
+            
+def writeDataset(folder, n_matches, matches_per_file=2_500, seed=0):
+    """
+    Writes n_matches matches into JSON files of matches_per_file matches each (25_000 rows,
+    the LIMIT of the SQL query). Records are written one at a time so memory stays flat.
+    Returns the list of written paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    records = generateMatches(n_matches, seed=seed)
+    paths = []
+    
+    for i, first in enumerate(range(0, n_matches, matches_per_file)):
+        path = os.path.join(folder, f'synthetic_{seed}_{i:05d}.json')
+        n_rows = 10 * min(matches_per_file, n_matches - first)
+        with open(path, 'w') as f:
+            f.write('[')
+            for j in range(n_rows):
+                if j:
+                    f.write(',\n')
+                f.write(json.dumps(next(records)))
+            f.write(']')
+        paths.append(path)
+        
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic OpenDota ward and objective data.')
+    parser.add_argument('--matches', type=int, default=1_000, help='number of matches')
+    parser.add_argument('--folder', default='data_synthetic', help='output folder')
+    parser.add_argument('--matches-per-file', type=int, default=2_500, help='matches in each JSON file')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    
+    paths = writeDataset(args.folder, args.matches, matches_per_file=args.matches_per_file, seed=args.seed)
+    print(f'Wrote {args.matches} matches to {len(paths)} files in {args.folder}')